@@ -1,5 +1,8 @@
+import json
 import pprint
 import random
+import time
+import tracemalloc
 import traceback
 from typing_extensions import deprecated
 import tqdm
@@ -7,6 +10,14 @@ import sys
 from engine.pdf_engine import PdfEngine
 from engine.pdf_renderer import BaseRenderer
 from engine.pdf_stream_parser import PDFStreamParser
+from engine.pdf_encoding import PdfEncoding as pnc
+from engine.pdf_utils import image_data_to_bgra, image_data_to_bgra_legacy
+from engine.pdf_utils import get_pdf_hash
+from engine.pdf_batch import run_batch_extraction
+from engine.pdf_render_cache import PageRenderCache
+from detectors.core_detectors import SymbolStream
+import numpy as np
+from PIL import Image
 from main import CmdArgs, all_subjects, igcse_path
 import os
 from os.path import sep
@@ -41,11 +52,19 @@ def do_tests(args: CmdArgs):
         # "pre-questions-show": do_show_question,
         # "questions-save": do_test_question,
         # -----
+        "parser-equivalence": do_test_parser_equivalence,
+        "operators-benchmark": do_test_operators_benchmark,
+        "render-benchmark": do_test_render_benchmark,
+        "glyphs-benchmark": do_test_glyphs_benchmark,
+        "memory-benchmark": do_test_memory_benchmark,
+        "inline-image": do_test_inline_image,
         "subjects": do_test_subjects_syllabus,
         "gui": do_run_gui_tester,
         "view-question": show_question,
         "view-page": show_page,
         "extract-questions": show_question,
+        "batch-extract": do_batch_extract,
+        "questions-replay": do_questions_replay,
     }
     if callbacks.get(args.test):
         callbacks[args.test](args)
@@ -298,6 +317,346 @@ def do_test_renderer(args: CmdArgs):
         # pprint.pprint(exception_stats)
 
 
+def do_test_parser_equivalence(args: CmdArgs):
+    """compare PDFStreamParser.LEXER_SINGLE_PASS against the legacy
+    LEXER_REGEX on every page and form-xobject stream of the given exams"""
+
+    print("********* Testing Parser Equivalence ************\n\n")
+    engine: PdfEngine = PdfEngine(scaling=1)
+    engine.set_files(args.data)
+    total_streams = 0
+    mismatches = []
+    skipped = []
+    while engine.proccess_next_pdf_file():
+        for page in range(1, engine.get_num_pages() + 1):
+            location = f"{engine.pdf_path}:{page}"
+            try:
+                engine.load_page_content(page)
+            except Exception as e:
+                skipped.append((location, str(e)))
+                continue
+            streams = [(location, engine.current_stream)]
+            streams.extend(
+                get_form_xobject_streams(engine, engine.res, location)
+            )
+            for location, stream in streams:
+                total_streams += 1
+                legacy = PDFStreamParser(PDFStreamParser.LEXER_REGEX)
+                single = PDFStreamParser(PDFStreamParser.LEXER_SINGLE_PASS)
+                legacy_cmds = [
+                    (cmd.name, cmd.args)
+                    for cmd in legacy.parse_stream(stream).iterate()
+                ]
+                single_cmds = [
+                    (cmd.name, operands_to_string(cmd.args))
+                    for cmd in single.parse_stream(stream).iterate()
+                ]
+                if legacy_cmds == single_cmds:
+                    continue
+                mismatches.append(location)
+                print(f"Mismatch: {location}")
+                for i, (c1, c2) in enumerate(zip(legacy_cmds, single_cmds)):
+                    if c1 != c2:
+                        print(f"  cmd[{i}] legacy={c1}\n  cmd[{i}] single={c2}")
+                        break
+                else:
+                    print(
+                        f"  legacy has {len(legacy_cmds)} cmds, "
+                        + f"single-pass has {len(single_cmds)} cmds"
+                    )
+
+    print("\n**********************************")
+    print("Total number of Streams = ", total_streams)
+    print("Mismatched Streams = ", len(mismatches))
+    print("Skipped Pages = ", len(skipped))
+    if mismatches:
+        pprint.pprint(mismatches)
+        raise Exception("single-pass lexer is NOT equivalent to regex lexer")
+
+
+def do_test_operators_benchmark(args: CmdArgs):
+    """operators/sec of PDFStreamParser over all page streams of the given
+    exams, once for parsing only and once with the explanation strings
+    (as written by the M_DEBUG_PAGE_STREAM output)"""
+
+    print("********* Benchmarking Operators ************\n\n")
+    engine: PdfEngine = PdfEngine(scaling=1)
+    engine.set_files(args.data)
+    streams = []
+    while engine.proccess_next_pdf_file():
+        for page in engine.reader.pages:
+            if page.get("/Contents") is None:
+                continue
+            data = engine.get_page_stream_data(page)
+            if data:
+                streams.append(data)
+
+    for title, explain in [("parse only", False), ("with explanation", True)]:
+        nr_operators = 0
+        start = time.perf_counter()
+        for stream in streams:
+            for cmd in PDFStreamParser().parse_stream(stream).iterate():
+                nr_operators += 1
+                explain and str(cmd)
+        duration = time.perf_counter() - start
+        print(
+            f"{title:<18}: {nr_operators} operators in {duration:.3f}s "
+            + f"= {nr_operators / duration:,.0f} operators/sec"
+        )
+
+
+def do_test_render_benchmark(args: CmdArgs):
+    """time render_pdf_page for every page of the given exams, with each
+    raster backend (e.g. --path PDFs/9709_m23_qp_12.pdf)"""
+
+    print("********* Benchmarking Page Rendering ************\n\n")
+    backends = [
+        ("cairo", PdfEngine.B_RASTER_CAIRO),
+        ("fitz", PdfEngine.B_RASTER_FITZ),
+        ("geometry", PdfEngine.B_GEOMETRY_ONLY),
+    ]
+    for title, backend in backends:
+        print(f"************ backend: {title}")
+        engine: PdfEngine = PdfEngine(scaling=4, backend=backend)
+        engine.set_files(args.data)
+        while engine.proccess_next_pdf_file():
+            print(f"{engine.pdf_path}")
+            durations = []
+            page_range = args.range or range(1, engine.get_num_pages() + 1)
+            for page in page_range:
+                start = time.perf_counter()
+                engine.render_pdf_page(page, debug=0, clean=0)
+                durations.append(time.perf_counter() - start)
+                cached, resolved = engine.resource_resolver.page_counts.get(
+                    page, (0, 0)
+                )
+                print(
+                    f"  page {page:>3}: {durations[-1] * 1000:8.1f} ms, "
+                    + f"resources: {resolved} resolved, {cached} cached"
+                )
+            print(
+                f"  total {sum(durations):.3f}s, "
+                + f"mean {sum(durations) / len(durations) * 1000:.1f} ms/page, "
+                + f"fonts: {engine.font_registry_misses} built, "
+                + f"{engine.font_registry_hits} shared, "
+                + f"matrix syncs: {engine.matrix_syncs} done, "
+                + f"{engine.matrix_changes - engine.matrix_syncs} avoided"
+            )
+
+
+def do_test_memory_benchmark(args: CmdArgs):
+    """tracemalloc peak of extract_questions_from_pdf for every given exam
+    (e.g. --path PDFs/9702_m23_qp_12.pdf), and the memory still held by
+    the result (questions + page segments). every run is compared with the
+    previous one (output/memory-benchmark.json)"""
+
+    print("********* Benchmarking Question Extraction Memory ************\n")
+    result_path = f"output{sep}memory-benchmark.json"
+    previous = {}
+    if os.path.exists(result_path):
+        with open(result_path, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+    results = {}
+    backends = [
+        ("fitz", PdfEngine.B_RASTER_FITZ),
+        ("geometry", PdfEngine.B_GEOMETRY_ONLY),
+    ]
+    for title, backend in backends:
+        print(f"************ backend: {title}")
+        engine: PdfEngine = PdfEngine(scaling=4, backend=backend)
+        engine.set_files(args.data)
+        while engine.proccess_next_pdf_file():
+            tracemalloc.start()
+            try:
+                engine.extract_questions_from_pdf(debug=0)
+                retained, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            key = f"{engine.pdf_name}:{title}"
+            results[key] = {
+                "pages": len(engine.pages),
+                "peak": peak,
+                "retained": retained,
+            }
+            report = f"  {engine.pdf_name:<30} pages {len(engine.pages):>3}"
+            for name in ("peak", "retained"):
+                report += f", {name} {results[key][name] / 2**20:7.2f} MB"
+                if key in previous and previous[key][name]:
+                    change = results[key][name] / previous[key][name] - 1
+                    report += f" ({change:+.1%})"
+            print(report)
+
+    os.makedirs("output", exist_ok=True)
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump({**previous, **results}, f, indent=2)
+
+
+def do_test_glyphs_benchmark(args: CmdArgs):
+    """glyphs/sec of the char_code -> (glyph_id, width, text) lookup, for
+    all text shown by the page streams of the given exams. compares the
+    per-font lookup tables (get_glyph_info) with the uncached path"""
+
+    print("********* Benchmarking Glyph Lookup ************\n\n")
+    engine: PdfEngine = PdfEngine(scaling=1)
+    engine.set_files(args.data)
+    # (font, char_code) for every shown glyph
+    glyphs = []
+    while engine.proccess_next_pdf_file():
+        for page in range(1, engine.get_num_pages() + 1):
+            try:
+                engine.load_page_content(page)
+            except Exception:
+                continue
+            font = None
+            font_stack = []
+            parser = PDFStreamParser().parse_stream(engine.current_stream)
+            for cmd in parser.iterate():
+                if cmd.name == "q":
+                    font_stack.append(font)
+                elif cmd.name == "Q":
+                    font = font_stack.pop()
+                elif cmd.name == "Tf":
+                    font = engine.font_map[cmd.args[0]]
+                elif cmd.name in ["Tj", "TJ", "'", '"']:
+                    text = cmd.args[-1]
+                    text_array = text if isinstance(text, list) else [text]
+                    for element in text_array:
+                        if isinstance(element, (bytes, memoryview)):
+                            glyphs.extend(get_char_codes(font, element))
+
+    for title, lookup in [
+        ("uncached", lambda f, c: f.create_glyph_info(c)),
+        ("lookup tables", lambda f, c: f.get_glyph_info(c)),
+    ]:
+        start = time.perf_counter()
+        for font, char_code in glyphs:
+            lookup(font, char_code)
+        duration = time.perf_counter() - start
+        print(
+            f"{title:<14}: {len(glyphs)} glyphs in {duration:.3f}s "
+            + f"= {len(glyphs) / duration:,.0f} glyphs/sec"
+        )
+
+
+def get_char_codes(font, element):
+    """same pairing as BaseRenderer.get_glyph_array"""
+    i = 0
+    while i < len(element):
+        char_code = element[i]
+        if font.is_type0:
+            if i < len(element) - 1:
+                char_code = (char_code << 8) | element[i + 1]
+            i += 1
+        i += 1
+        yield font, char_code
+
+
+def do_test_inline_image(args: CmdArgs):
+    """pixel-exact check of image_data_to_bgra (numpy) against the per-pixel
+    loops of image_data_to_bgra_legacy, and against PIL for the 8 bit
+    RGB/CMYK layouts the loops never converted"""
+
+    print("********* Testing Inline Image Conversion ************\n\n")
+    rng = np.random.default_rng(0)
+    fill_color = (10, 120, 250)
+    sizes = [(1, 1), (7, 3), (8, 8), (13, 5), (64, 17)]
+    failed = []
+
+    def check(title, expected, result):
+        ok = result is not None and np.array_equal(expected, result)
+        print(f"{'OK' if ok else 'FAILED':<7}: {title}")
+        ok or failed.append(title)
+
+    for width, height in sizes:
+        count = width * height
+        cases = [
+            (1, "/DeviceGray", (count + 7) // 8),
+            (1, "/DeviceGray", count // 16),  # truncated stencil data
+            (1, "/DeviceRGB", (count + 7) // 8),
+            (8, "/DeviceGray", count),
+            (24, "/DeviceRGB", count * 3),
+        ]
+        for bpc, cs, size in cases:
+            data = rng.integers(0, 256, size, dtype=np.uint8).tobytes()
+            image_args = (data, width, height, bpc, cs, fill_color)
+            check(
+                f"{cs} {bpc} bpc {width}x{height} ({size} bytes)",
+                image_data_to_bgra_legacy(*image_args),
+                image_data_to_bgra(*image_args),
+            )
+
+        for cs, mode in [("/DeviceRGB", "RGB"), ("/DeviceCMYK", "CMYK")]:
+            data = rng.integers(0, 256, count * len(mode), dtype=np.uint8)
+            img = Image.frombytes(mode, (width, height), data.tobytes())
+            expected = bytearray()
+            for r, g, b in img.convert("RGB").getdata():
+                expected.extend([b, g, r, 255])
+            expected = np.frombuffer(expected, dtype=np.uint8).reshape(
+                height, width, 4
+            )
+            check(
+                f"{cs} 8 bpc {width}x{height} (PIL)",
+                expected,
+                image_data_to_bgra(
+                    memoryview(data.tobytes()), width, height, 8, cs, fill_color
+                ),
+            )
+
+    width, height = 600, 400
+    data = rng.integers(0, 256, width * height, dtype=np.uint8).tobytes()
+    image_args = (data, width, height, 8, "/DeviceGray", fill_color)
+    for title, convert in [
+        ("per-pixel", image_data_to_bgra_legacy),
+        ("numpy", image_data_to_bgra),
+    ]:
+        start = time.perf_counter()
+        convert(*image_args)
+        duration = time.perf_counter() - start
+        print(f"{title:<10}: {width}x{height} gray in {duration * 1000:.1f} ms")
+
+    if failed:
+        pprint.pprint(failed)
+        raise Exception("image_data_to_bgra is NOT pixel-exact")
+
+
+def operands_to_string(operands):
+    """the legacy lexer works on (unicode_escape decoded) text,
+    show raw byte operands the same way"""
+    if isinstance(operands, (bytes, memoryview)):
+        return pnc.bytes_to_string(bytes(operands))
+    if isinstance(operands, list):
+        return [operands_to_string(op) for op in operands]
+    if isinstance(operands, dict):
+        return {k: operands_to_string(v) for k, v in operands.items()}
+    return operands
+
+
+def get_form_xobject_streams(engine: PdfEngine, res, location, seen=None):
+    """collect (location, stream) for all (nested) form xobjects in res"""
+    seen = set() if seen is None else seen
+    streams = []
+    for name, xobj in (engine.get_x_object(res) or {}).items():
+        xobj = xobj.get_object()
+        ref = xobj.indirect_reference
+        if ref is not None:
+            if ref.idnum in seen:
+                continue
+            seen.add(ref.idnum)
+        if xobj.get("/Subtype") != "/Form":
+            continue
+        stream = xobj.get_data()
+        x_location = f"{location}:{name}"
+        streams.append((x_location, stream))
+        x_res = xobj.get("/Resources")
+        if x_res is not None:
+            streams.extend(
+                get_form_xobject_streams(
+                    engine, x_res.get_object(), x_location, seen
+                )
+            )
+    return streams
+
+
 def get_exception_key(e: Exception):
 
     exc_type = type(e).__name__
@@ -392,7 +751,10 @@ def show_question(args: CmdArgs):
     debugging = args.debug and PdfEngine.M_DEBUG_DETECTOR
     is_extract = args.test == "extract-questions"
     clean = args.clean
-    engine: PdfEngine = PdfEngine(4, debugging, clean)
+    engine: PdfEngine = PdfEngine(4, clean)
+    args.render_cache and engine.set_render_cache(
+        PageRenderCache(args.render_cache)
+    )
     print(args.data, type(args.data))
     engine.set_files(args.data)
     if not is_extract:
@@ -404,7 +766,9 @@ def show_question(args: CmdArgs):
         print(f"{engine.pdf_path}")
         if not is_ok:
             break
-        engine.extract_questions_from_pdf()
+        engine.extract_questions_from_pdf(
+            debug=debugging, workers=args.workers
+        )
         if is_extract:
             engine.question_detector.print_final_results(engine.pdf_path)
         else:
@@ -413,10 +777,62 @@ def show_question(args: CmdArgs):
                 gui.show_page(q_surf, True)
 
 
+def do_batch_extract(args: CmdArgs):
+    """detect the questions of all selected exams and save them as
+    <subject>/detected/<exam>.json, exams already detected (same pdf hash)
+    are skipped unless --force"""
+    results = run_batch_extraction(args.data, args.workers, args.force)
+    failed = [k for k, v in results.items() if v["status"] != "done"]
+    print(f"done: {len(results) - len(failed)}, failed: {len(failed)}")
+    for exam_id in failed:
+        print(f"\n***** {exam_id}\n{results[exam_id]['error']}")
+
+
+def do_questions_replay(args: CmdArgs):
+    """detect the questions from the recorded symbol streams of the exams
+    (temp/symbols/<exam>.npz), an exam without a (valid) stream is
+    interpreted once and recorded, --force records all of them again"""
+    engine: PdfEngine = PdfEngine(4, 2, backend=PdfEngine.B_GEOMETRY_ONLY)
+    engine.set_files(args.data)
+    os.makedirs(f"temp{sep}symbols", exist_ok=True)
+    replay_time = 0
+    while engine.proccess_next_pdf_file():
+        exam_id = engine.pdf_name.split(".")[0]
+        path = f"temp{sep}symbols{sep}{exam_id}.npz"
+        meta = {
+            "hash": get_pdf_hash(engine.pdf_path),
+            "version": PdfEngine.ENGINE_VERSION,
+            "scaling": engine.scaling,
+            "clean": engine.clean,
+        }
+        streams = None
+        if os.path.exists(path) and not args.force:
+            streams, stored_meta = SymbolStream.load(path)
+            streams = streams if stored_meta == meta else None
+        if streams is None:
+            print(f"recording {exam_id}")
+            streams = engine.record_symbol_streams()
+            SymbolStream.save(path, streams, **meta)
+
+        t0 = time.perf_counter()
+        try:
+            engine.extract_questions_from_streams(streams)
+        except Exception as e:
+            print(e)
+            continue
+        finally:
+            replay_time += time.perf_counter() - t0
+        engine.question_detector.print_final_results(engine.pdf_path)
+    print(f"\ndetection time (replay only): {replay_time:.3f}s")
+
+
 def show_page(args: CmdArgs):
     debugging = args.debug and PdfEngine.M_DEBUG
     clean = args.clean  # args.clean and(  PdfEngine.O_CLEAN_HEADER_FOOTER )
-    engine: PdfEngine = PdfEngine(4, debugging, clean)
+    engine: PdfEngine = PdfEngine(4, clean)
+    args.render_cache and engine.set_render_cache(
+        PageRenderCache(args.render_cache)
+    )
     engine.set_files(args.data)
     gui.start(-1, -1)
     wrong_list = []
@@ -1,4 +1,7 @@
-from models.core_models import SymSequence
+import json
+from array import array
+import numpy as np
+from models.core_models import SymSequence, SymbolTable
 
 
 class BaseDetector:
@@ -26,6 +29,175 @@ class BaseDetector:
         pass
 
 
+class SymbolStream(SymbolTable):
+    """
+    the symbols of one page in columnar arrays (char, x, y, w, h, font id),
+    every sequence is a slice of the columns (seq_ends holds the end
+    offsets), fonts maps a font id to the base font name
+    """
+
+    __slots__ = (
+        "page",
+        "page_width",
+        "page_height",
+        "font_ids",
+        "seq_ends",
+        "fonts",
+    )
+
+    def __init__(self, page: int, page_width, page_height) -> None:
+        super().__init__()
+        self.page = page
+        self.page_width = page_width
+        self.page_height = page_height
+        self.font_ids = array("i")
+        self.seq_ends = array("i")
+        self.fonts: list[str | None] = []
+
+    def get_font_id(self, font: str | None):
+        if font not in self.fonts:
+            self.fonts.append(font)
+        return self.fonts.index(font)
+
+    def add_sequence(self, seq: SymSequence):
+        font_id = self.get_font_id(seq.font)
+        chars, x, y, w, h = seq.get_columns()
+        self.chars.extend(chars)
+        self.x.extend(x)
+        self.y.extend(y)
+        self.w.extend(w)
+        self.h.extend(h)
+        self.font_ids.extend([font_id] * len(chars))
+        self.seq_ends.append(len(self.chars))
+
+    def iterate_sequences(self):
+        start = 0
+        for end in self.seq_ends:
+            yield SymSequence.from_table(
+                self, range(start, end), self.fonts[self.font_ids[start]]
+            )
+            start = end
+
+    def replay(self, detector: BaseDetector):
+        detector.attach(self.page_width, self.page_height, self.page)
+        for seq in self.iterate_sequences():
+            detector.handle_sequence(seq, self.page)
+
+    # ****************************************************************
+    # ********************* Serialization
+    # one .npz per pdf, the columns of all pages are concatenated
+    # (no pickle, so the file can be loaded with allow_pickle=False)
+
+    @staticmethod
+    def save(path: str, streams: list["SymbolStream"], **meta):
+        np.savez_compressed(path, **SymbolStream.to_arrays(streams, **meta))
+
+    @staticmethod
+    def load(path: str) -> tuple[list["SymbolStream"], dict]:
+        with np.load(path, allow_pickle=False) as data:
+            return SymbolStream.from_arrays(data)
+
+    @staticmethod
+    def to_arrays(streams: list["SymbolStream"], **meta) -> dict:
+        """the named arrays of the .npz file"""
+        fonts: list[str] = []
+        font_ids = []
+        for stream in streams:
+            remap = []
+            for font in stream.fonts:
+                font = font or ""
+                if font not in fonts:
+                    fonts.append(font)
+                remap.append(fonts.index(font))
+            remap = np.asarray(remap, dtype=np.int32)
+            font_ids.append(remap[np.frombuffer(stream.font_ids, np.int32)])
+        chars = [ch for stream in streams for ch in stream.chars]
+        text = "".join(chars).encode("utf-32-le", "surrogatepass")
+        columns = {
+            name: np.concatenate(
+                [np.frombuffer(getattr(st, name)) for st in streams]
+                or [np.empty(0)]
+            )
+            for name in ("x", "y", "w", "h")
+        }
+        pages = [
+            (st.page, st.page_width, st.page_height, len(st.seq_ends))
+            for st in streams
+        ]
+        return dict(
+            meta=np.array(json.dumps(meta)),
+            pages=np.array(pages, dtype=np.int64).reshape(-1, 4),
+            seq_ends=np.concatenate(
+                [np.frombuffer(st.seq_ends, np.int32) for st in streams]
+                or [np.empty(0, np.int32)]
+            ),
+            char_codes=np.frombuffer(text, dtype=np.uint32),
+            char_lens=np.array([len(ch) for ch in chars], dtype=np.int32),
+            font_ids=np.concatenate(font_ids or [np.empty(0, np.int32)]),
+            fonts=np.array(fonts, dtype=str),
+            **columns,
+        )
+
+    @staticmethod
+    def from_arrays(data) -> tuple[list["SymbolStream"], dict]:
+        """data: the named arrays of to_arrays (e.g. the loaded .npz)"""
+        text = data["char_codes"].tobytes()
+        text = text.decode("utf-32-le", "surrogatepass")
+        char_ends = np.cumsum(data["char_lens"]).tolist()
+        chars = [
+            text[start:end] for start, end in zip([0] + char_ends, char_ends)
+        ]
+        fonts = [font or None for font in data["fonts"].tolist()]
+        x, y, w, h = (data[name] for name in ("x", "y", "w", "h"))
+        font_ids, seq_ends = data["font_ids"], data["seq_ends"]
+        streams = []
+        sym_start = seq_start = 0
+        for page, width, height, seq_count in data["pages"].tolist():
+            stream = SymbolStream(page, width, height)
+            ends = seq_ends[seq_start : seq_start + seq_count]
+            seq_start += seq_count
+            sym_end = int(ends[-1]) if seq_count else 0
+            sl = slice(sym_start, sym_start + sym_end)
+            sym_start += sym_end
+            stream.chars = chars[sl]
+            stream.x, stream.y = array("d", x[sl]), array("d", y[sl])
+            stream.w, stream.h = array("d", w[sl]), array("d", h[sl])
+            # global font ids are kept, fonts is the table of the file
+            stream.font_ids = array("i", font_ids[sl])
+            stream.seq_ends = array("i", ends)
+            stream.fonts = fonts
+            streams.append(stream)
+        return streams, json.loads(data["meta"].item())
+
+
+class SequenceRecorder(BaseDetector):
+    """
+    records the sequences of every attached page as SymbolStreams
+    (compact and picklable), so they can be replayed later into another
+    detector (e.g. the stateful QuestionDetector, in page order, in the
+    main process)
+    """
+
+    def __init__(self, id: int) -> None:
+        super().__init__(id)
+        self.pages: list[SymbolStream] = []
+
+    def attach(self, page_width, page_height, page: int):
+        super().attach(page_width, page_height, page)
+        self.pages.append(SymbolStream(page, page_width, page_height))
+
+    def handle_sequence(self, seq: SymSequence, page: int):
+        self.pages[-1].add_sequence(seq)
+
+    def on_restart(self):
+        self.pages = []
+
+    @staticmethod
+    def replay(pages: list[SymbolStream], detector: BaseDetector):
+        for stream in pages:
+            stream.replay(detector)
+
+
 class LineDetector(BaseDetector):
     pass
 
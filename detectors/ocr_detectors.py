@@ -35,6 +35,7 @@ class BlockType:
 
 
 class OcrItem(Box):
+    __slots__ = ("np_src_image", "x1", "y1", "html")
 
     OCR_OUTPUT_DIR = os.path.join(".", "output", "question-html")
     OCR_PAGE_WIDTH = 0
@@ -71,6 +72,8 @@ class OcrItem(Box):
 
 
 class OcrBlock(OcrItem):
+    __slots__ = ("type", "is_nested", "sub_blocks", "lines")
+
     def __init__(self, json_dict: dict, src_image_array) -> None:
         super().__init__(json_dict, src_image_array)
         self.type = json_dict["type"]
@@ -120,6 +123,8 @@ class OcrBlock(OcrItem):
 
 
 class OcrLine(OcrItem):
+    __slots__ = ("spans",)
+
     def __init__(self, json_dict: dict, src_image_array) -> None:
         super().__init__(json_dict, src_image_array)
         self.spans: list[OcrSpan] = []
@@ -138,6 +143,15 @@ class OcrLine(OcrItem):
 
 
 class OcrSpan(OcrItem):
+    __slots__ = (
+        "type",
+        "score",
+        "image_path",
+        "image_surf",
+        "table_html",
+        "is_latex",
+        "content",
+    )
 
     def __init__(self, json_dict: dict, src_image_array) -> None:
         super().__init__(json_dict, src_image_array)
@@ -325,7 +325,7 @@ class QuestionDetector(QuestionDetectorBase):
             return
 
         if seg and self.bufferd_line.row_align_with(seg, self.line_height):
-            self.bufferd_line.extend(seg.data)
+            self.bufferd_line.extend(seg)
         else:
             # print(
             #     "exec buffered Line", self.bufferd_line.get_text(verbose=False)
@@ -30,6 +30,72 @@ class PycairoContext(ct.Structure):
     ]
 
 
+# memory buffers backing FT_New_Memory_Face faces, keyed by their address,
+# released by cairo (through the font face user data) when the face dies
+_memory_font_buffers = {}
+_DESTROY_FUNC = ct.CFUNCTYPE(None, ct.c_void_p)
+
+
+@_DESTROY_FUNC
+def _release_memory_font_buffer(address):
+    _memory_font_buffers.pop(address, None)
+
+
+def _initialize():
+    global _initialized
+    global _ft_lib
+    global _ft_destroy_key
+    global _buffer_destroy_key
+    global _surface
+
+    FT_Err_Ok = 0
+    if _initialized:
+        return
+
+    _cairo_so.cairo_ft_font_face_create_for_ft_face.restype = ct.c_void_p
+    _cairo_so.cairo_ft_font_face_create_for_ft_face.argtypes = [
+        ct.c_void_p,
+        ct.c_int,
+    ]
+    _cairo_so.cairo_font_face_get_user_data.restype = ct.c_void_p
+    _cairo_so.cairo_font_face_get_user_data.argtypes = (
+        ct.c_void_p,
+        ct.c_void_p,
+    )
+    _cairo_so.cairo_font_face_set_user_data.argtypes = (
+        ct.c_void_p,
+        ct.c_void_p,
+        ct.c_void_p,
+        ct.c_void_p,
+    )
+    _cairo_so.cairo_set_font_face.argtypes = [ct.c_void_p, ct.c_void_p]
+    _cairo_so.cairo_font_face_status.argtypes = [ct.c_void_p]
+    _cairo_so.cairo_font_face_destroy.argtypes = (ct.c_void_p,)
+    _cairo_so.cairo_status.argtypes = [ct.c_void_p]
+
+    _cairo_so.cairo_ft_scaled_font_lock_face.restype = ct.c_void_p
+    _cairo_so.cairo_ft_scaled_font_lock_face.argtypes = [ct.c_void_p]
+    _cairo_so.cairo_ft_scaled_font_unlock_face.argtypes = [ct.c_void_p]
+
+    _freetype_so.FT_New_Memory_Face.argtypes = [
+        ct.c_void_p,
+        ct.c_void_p,
+        ct.c_long,
+        ct.c_long,
+        ct.c_void_p,
+    ]
+    # initialize freetype
+    _ft_lib = ct.c_void_p()
+    status = _freetype_so.FT_Init_FreeType(ct.byref(_ft_lib))
+    if status != FT_Err_Ok:
+        raise RuntimeError("Error %d initializing FreeType library." % status)
+
+    _surface = cairo.ImageSurface(cairo.FORMAT_A8, 0, 0)
+    _ft_destroy_key = ct.c_int()  # dummy address
+    _buffer_destroy_key = ct.c_int()  # dummy address
+    _initialized = True
+
+
 def create_cairo_font_face_for_file(
     filename,
     faceindex=0,
@@ -38,60 +104,54 @@ def create_cairo_font_face_for_file(
     # encoding=ADBC
 ):
     "given the name of a font file, and optional faceindex to pass to FT_New_Face" " and loadoptions to pass to cairo_ft_font_face_create_for_ft_face, creates" " a cairo.FontFace object that may be used to render text with that font."
-    global _initialized
-    global _freetype_so
-    global _cairo_so
-    global _ft_lib
-    global _ft_destroy_key
-    global _surface
+    _initialize()
+    ft_face = ct.c_void_p()
+    status = _freetype_so.FT_New_Face(
+        _ft_lib, filename.encode("utf-8"), faceindex, ct.byref(ft_face)
+    )
+    return _create_cairo_font_face(
+        ft_face, status, filename, loadoptions, encoding
+    )
 
-    CAIRO_STATUS_SUCCESS = 0
-    FT_Err_Ok = 0
-    cairo_ctx = None
-    if not _initialized:
-
-        _cairo_so.cairo_ft_font_face_create_for_ft_face.restype = ct.c_void_p
-        _cairo_so.cairo_ft_font_face_create_for_ft_face.argtypes = [
-            ct.c_void_p,
-            ct.c_int,
-        ]
-        _cairo_so.cairo_font_face_get_user_data.restype = ct.c_void_p
-        _cairo_so.cairo_font_face_get_user_data.argtypes = (
-            ct.c_void_p,
-            ct.c_void_p,
-        )
-        _cairo_so.cairo_font_face_set_user_data.argtypes = (
-            ct.c_void_p,
-            ct.c_void_p,
-            ct.c_void_p,
-            ct.c_void_p,
+
+def create_cairo_font_face_for_memory(
+    font_data: bytes,
+    name="<memory>",
+    faceindex=0,
+    loadoptions=0,
+    encoding=None,
+):
+    """same as create_cairo_font_face_for_file, but the font program is
+    loaded from memory (FT_New_Memory_Face), no file is written/read.
+    the buffer is kept alive as long as the cairo font face exists"""
+    _initialize()
+    buffer = ct.create_string_buffer(font_data, len(font_data))
+    address = ct.addressof(buffer)
+    _memory_font_buffers[address] = buffer
+    ft_face = ct.c_void_p()
+    status = _freetype_so.FT_New_Memory_Face(
+        _ft_lib, address, len(font_data), faceindex, ct.byref(ft_face)
+    )
+    try:
+        face = _create_cairo_font_face(
+            ft_face, status, name, loadoptions, encoding, address
         )
-        _cairo_so.cairo_set_font_face.argtypes = [ct.c_void_p, ct.c_void_p]
-        _cairo_so.cairo_font_face_status.argtypes = [ct.c_void_p]
-        _cairo_so.cairo_font_face_destroy.argtypes = (ct.c_void_p,)
-        _cairo_so.cairo_status.argtypes = [ct.c_void_p]
-
-        _cairo_so.cairo_ft_scaled_font_lock_face.restype = ct.c_void_p
-        _cairo_so.cairo_ft_scaled_font_lock_face.argtypes = [ct.c_void_p]
-        _cairo_so.cairo_ft_scaled_font_unlock_face.argtypes = [ct.c_void_p]
-        # initialize freetype
-        _ft_lib = ct.c_void_p()
-        status = _freetype_so.FT_Init_FreeType(ct.byref(_ft_lib))
-        if status != FT_Err_Ok:
-            raise RuntimeError(
-                "Error %d initializing FreeType library." % status
-            )
+    except Exception:
+        _memory_font_buffers.pop(address, None)
+        raise
+    if face is None:
+        _memory_font_buffers.pop(address, None)
+    return face
 
-        _surface = cairo.ImageSurface(cairo.FORMAT_A8, 0, 0)
-        _ft_destroy_key = ct.c_int()  # dummy address
-        _initialized = True
 
-    ft_face = ct.c_void_p()
+def _create_cairo_font_face(
+    ft_face, status, filename, loadoptions, encoding, buffer_address=None
+):
+    CAIRO_STATUS_SUCCESS = 0
+    FT_Err_Ok = 0
+    cairo_ctx = None
     cr_face = None
     try:
-        status = _freetype_so.FT_New_Face(
-            _ft_lib, filename.encode("utf-8"), faceindex, ct.byref(ft_face)
-        )
 
         if status != FT_Err_Ok:
             raise RuntimeError(
@@ -135,6 +195,21 @@ def create_cairo_font_face_for_file(
                 )
             ft_face = None  # Cairo has stolen my reference
 
+        if buffer_address is not None:
+            # the face reads the font program from this buffer,
+            # release it only when cairo destroys the face
+            status = _cairo_so.cairo_font_face_set_user_data(
+                cr_face,
+                ct.byref(_buffer_destroy_key),
+                buffer_address,
+                _release_memory_font_buffer,
+            )
+            if status != CAIRO_STATUS_SUCCESS:
+                raise RuntimeError(
+                    "Error %d attaching font buffer for %s"
+                    % (status, filename)
+                )
+
         cairo_ctx = cairo.Context(_surface)
         cairo_t = PycairoContext.from_address(id(cairo_ctx)).ctx
         _cairo_so.cairo_set_font_face(cairo_t, cr_face)
@@ -22,7 +22,7 @@ from pypdf.filters import (
 )
 from cairo import Matrix
 from .pdf_encoding import PdfEncoding as pnc
-import copy
+from operator import attrgetter
 
 
 class EngineState:
@@ -48,6 +48,7 @@ class EngineState:
     FALLBACK_CS = "/Unsupported"
 
     SUPPORTED_CS = [*DEVICE_CS, FALLBACK_CS]
+    CS_COMPONENTS = {"/DeviceGray": 1, "/DeviceRGB": 3, "/DeviceCMYK": 4}
 
     DEFAULT_COLORS = {
         "/DeviceGray": [0, 0, 0],
@@ -56,6 +57,48 @@ class EngineState:
         FALLBACK_CS: [0, 0, 0],
     }
 
+    # the graphics state saved by q and restored by Q, a snapshot is a plain
+    # tuple of these attributes (no copies), so none of them may be modified
+    # in place: lists are always replaced, matrices are never translated in
+    # place. the cached device matrices are part of the snapshot, they stay
+    # valid after Q
+    SAVED_STATE = (
+        "_cm_matrix",
+        "_tm_matrix",
+        "_device_matrix",
+        "_text_device_matrix",
+        "text_position",
+        "character_spacing",
+        "word_spacing",
+        "horizontal_scaling",
+        "leading",
+        # fonts are shared (per document), keep the object itself,
+        # resource names may differ between pages/xobjects
+        "font",
+        "font_size",
+        "text_rize",
+        "line_width",
+        "position",
+        "dash_pattern",
+        "stroke_color",
+        "fill_color",
+        "color_space_stroke",
+        "color_space_fill",
+        "_stroke_alpha",
+        "_fill_alpha",
+        "miter_limit",
+        "line_cap",
+        "line_join",
+        # inline image
+        "inline_image_width",
+        "inline_image_height",
+        "inline_image_bits_per_component",
+        "inline_image_mask",
+        "text_rendering_mode",
+    )
+    get_saved_state = attrgetter(*SAVED_STATE)
+    FLIP_Y = Matrix(1, 0, 0, -1, 0, 0)
+
     def __init__(
         self,
         font_map: dict[str, PdfFont],
@@ -63,7 +106,7 @@ class EngineState:
         resources: dict,
         exgstat: dict[str, Any],
         xobj: dict[str, Any],
-        initial_state: dict | None,
+        initial_state: tuple[tuple, Matrix] | None,
         execute_xobject_stream: callable,
         stream_name: str,
         draw_image: callable,
@@ -97,6 +140,12 @@ class EngineState:
         # *************** location tracking variables ******************
         CTM = [scale, 0.0, 0.0, scale, 0.0, 0.0]
         text_matrix = [1.0, 0.0, 0.0, 1.0, 0.0, 0.0]
+        # cm/tm * flip-y, see get_current_matrix
+        self._device_matrix: Matrix | None = None
+        self._text_device_matrix: Matrix | None = None
+        # the device matrix changed since the renderer pushed it to cairo
+        self.matrix_dirty = True
+        self.matrix_changes = 0
         self.cm_matrix = Matrix(*CTM)
         self.tm_matrix = Matrix(*text_matrix)  # for text
         self.text_position = [0.0, 0.0]  # for text
@@ -128,7 +177,7 @@ class EngineState:
         self.line_cap = cairo.LINE_CAP_BUTT
         self.line_join = cairo.LINE_JOIN_MITER
         self.miter_limit = 10.0
-        self.state_stack: list[dict] = []
+        self.state_stack: list[tuple] = []
 
         self.inline_image_width = 0
         self.inline_image_height = 0
@@ -160,7 +209,9 @@ class EngineState:
         # *************** END Variables ******************
 
         if initial_state:
-            self.restore_state(None, initial_state)
+            state, cm_matrix = initial_state
+            self.restore_state(None, state)
+            self.cm_matrix = cm_matrix
 
         self.functions_map = {
             # generall
@@ -238,6 +289,8 @@ class EngineState:
             # "h": self.close_path,
             # "c": self.curve_to,
         }
+        # functions_map by opcode, built on first use
+        self.dispatch_table: list | None = None
 
     def handle_sh_operator(self, command: PdfOperator):
         return "", True
@@ -374,9 +427,10 @@ class EngineState:
 
         return "", True
 
-    def _merge_resources(self, form_resources):
+    @staticmethod
+    def merge_resources(parent_resources, form_resources):
         # Convert PDF dictionaries to normal dicts
-        parent_res = {k: v for k, v in self.res.items()}
+        parent_res = {k: v for k, v in parent_resources.items()}
         form_res = {k: v for k, v in form_resources.items()}
         # print("parent_res")
         # pprint(parent_res)
@@ -440,7 +494,8 @@ class EngineState:
             )
             return
 
-        self.ctx.save()
+        # no ctx for GeometryRenderer
+        self.ctx and self.ctx.save()
         # self.save_state(None)
 
         # Apply form matrix (default: identity)
@@ -450,23 +505,15 @@ class EngineState:
         form_matrix = curr_cm.multiply(form_matrix)
         # self.ctx.transform(Matrix(*form_matrix))
 
-        initial_state = self.dump_dict()
-        initial_state["cm_matrix"] = form_matrix
-
-        form_resources = xobj.get("/Resources", {})
-        merged_resources = self._merge_resources(form_resources)
+        initial_state = (self.dump_state(), form_matrix)
 
-        # Process form content stream
-        # filters = xobj.get("/Filter", [])
-        data = xobj.get_data()
-        stream = (
-            pnc.bytes_to_string(data).encode("latin1").decode("unicode_escape")
-        )
+        # Process form content stream, the engine merges the resources
+        # with ours and parses the stream (once per document)
         self.execute_xobject_stream(
-            stream, initial_state, merged_resources, new_depth, xobj_name
+            xobj, self.res, initial_state, new_depth, xobj_name
         )
 
-        self.ctx.restore()
+        self.ctx and self.ctx.restore()
         # self.restore_state(None)
 
     def _draw_image_xobject(self, xobj):
@@ -495,19 +542,21 @@ class EngineState:
             soll_pixel_count = (
                 self.inline_image_height * self.inline_image_width
             )
-            bytes_per_component = self.inline_image_bits_per_component // 8
-            ist_pixel_count = (
-                len(self.inline_image_data) // bytes_per_component
-            )
+            cs = self.inline_image_color_space
+            bytes_per_pixel = self.inline_image_bits_per_component // 8
+            if bytes_per_pixel == 1:
+                # 8 bit per component, one byte for each color component
+                bytes_per_pixel = self.CS_COMPONENTS.get(cs, 1)
+            ist_pixel_count = len(self.inline_image_data) // bytes_per_pixel
 
             # print(f"soll-ist : {soll_pixel_count} vs {ist_pixel_count}")
             if soll_pixel_count != ist_pixel_count:
                 raise Exception("This image is not OK")
-            cs = self.inline_image_color_space
-            if cs == "/DeviceRGB" and bytes_per_component != 3:
+            if cs == "/DeviceRGB" and bytes_per_pixel not in [3, 4]:
+                # 4 : already BGRA (decode_dct)
                 raise Exception("image values for RGB are not devidable by 3")
                 pass
-            elif cs == "/DeviceCMYK":
+            elif cs == "/DeviceCMYK" and bytes_per_pixel != 4:
                 raise Exception("image values for CMYK are not devidable by 4")
                 pass
         elif self.inline_image_bits_per_component != 1:
@@ -528,18 +577,52 @@ class EngineState:
 
     def end_text(self, _: PdfOperator):
         self.in_text_block = False
+        self.matrix_dirty = True
+        self.matrix_changes += 1
         return "", True
 
+    @property
+    def cm_matrix(self) -> Matrix:
+        return self._cm_matrix
+
+    @cm_matrix.setter
+    def cm_matrix(self, matrix: Matrix):
+        self._cm_matrix = matrix
+        self._device_matrix = None
+        self._text_device_matrix = None
+        self.matrix_dirty = True
+        self.matrix_changes += 1
+
+    @property
+    def tm_matrix(self) -> Matrix:
+        return self._tm_matrix
+
+    @tm_matrix.setter
+    def tm_matrix(self, matrix: Matrix):
+        self._tm_matrix = matrix
+        self._text_device_matrix = None
+        self.matrix_dirty = True
+        self.matrix_changes += 1
+
+    def translate_text_matrix(self, x, y):
+        """same as tm_matrix.translate(x, y), but the matrix is replaced
+        (it may be shared with a saved state)"""
+        self.tm_matrix = Matrix(1, 0, 0, 1, x, y).multiply(self._tm_matrix)
+
     def get_current_matrix(
         self,
     ):
-        """Get the appropriate transformation matrix based on context"""
-
-        cc0 = cairo.Matrix(1, 0, 0, -1, 0, self.screen_height)
-        cm = self.cm_matrix
-        if self.in_text_block:
-            tm = self.tm_matrix
-            cc1 = cairo.Matrix(1, 0, 0, -1, 0, 0)
+        """Get the appropriate transformation matrix based on context,
+        the matrix is cached until cm/tm change, it must not be modified"""
+
+        m = self._device_matrix
+        if m is None:
+            cc0 = Matrix(1, 0, 0, -1, 0, self.screen_height)
+            m = self._device_matrix = self._cm_matrix.multiply(cc0)
+        if not self.in_text_block:
+            return m
+        tm = self._text_device_matrix
+        if tm is None:
             # fz = self.font_size
             # tm_pre_matrix = Matrix(
             #     fz * self.horizontal_scaling * 1,
@@ -549,10 +632,9 @@ class EngineState:
             #     0,
             #     self.text_rize,
             # )
-            return cc1.multiply(tm.multiply(cm.multiply(cc0)))
-        else:
-            cc1 = cairo.Matrix(1, 0, 0, 1, 0, 0)
-            return cc1.multiply(cm.multiply(cc0))
+            tm = self.FLIP_Y.multiply(self._tm_matrix.multiply(m))
+            self._text_device_matrix = tm
+        return tm
 
     def decode_lzw(self, data: bytes):
         return LZWDecode.decode(data)
@@ -588,15 +670,12 @@ class EngineState:
         # self.inline_image_color_space = "/DeviceRGB"
         return decoeded
 
+    @staticmethod
     def cmyk_to_bgrx(cmyk_data, width, height):
         """Convert CMYK to Cairo's BGRx format"""
         img = Image.frombytes("CMYK", (width, height), cmyk_data)
-        img = img.convert("RGB")
-        bgrx = bytearray()
-        for r, g, b in img.getdata():
-            bgrx.extend([b, g, r, 0])  # BGRx format
-
-        return bytes(bgrx)
+        # the raw encoder swizzles the channels, x = 0
+        return img.convert("RGB").tobytes("raw", "BGRX")
 
     def test_play_image(self, img):
         img_path = f"output{sep}temp-image.png"
@@ -606,24 +685,19 @@ class EngineState:
         kill_with_taskkill()
 
     def decode_dct(self, data: bytes):
+        """decode the jpeg directly to cairo's BGRA (ARGB32) byte order,
+        the result is marked with bits_per_component = 32"""
         img = Image.open(io.BytesIO(data))
         # if img.has_transparency_data:
         #     input("the image has transparency data")
-        img = img.convert("RGB")
-        width, height = img.size
-        bgrx_data = bytearray()
-        # rgb_data = bytearray()
-        for r, g, b in img.getdata():
-            bgrx_data.extend([b, g, r])  # 0 = unused alpha
-            # max_byte = max(r, g, b)
-            # f = 255 // max_byte
-            # rgb_data.extend([r * f, g * f, b * f])
-        # img2 = Image.frombytes("RGB", size=img.size, data=rgb_data)
-        # self.test_play_image(img2)
-        self.inline_image_bits_per_component = 24
+        # gray, rgb and (adobe) cmyk jpegs are all converted by PIL
+        if img.mode != "RGBA":
+            img = img.convert("RGBA")
+        self.inline_image_width, self.inline_image_height = img.size
+        self.inline_image_bits_per_component = 32
         self.inline_image_color_space = "/DeviceRGB"
 
-        return bytes(bgrx_data)
+        return img.tobytes("raw", "BGRA")
 
     def decode_ascii85(self, data: bytes):
         return ASCII85Decode.decode(data)
@@ -659,6 +733,9 @@ class EngineState:
             data = pnc.string_to_bytes(data)
 
         decoded_data = data
+        if self.inline_image_filter and isinstance(data, memoryview):
+            # the decoders expect bytes, only copy when there is a filter
+            decoded_data = bytes(data)
         for filter_name in self.inline_image_filter:
             filter_name = filter_name.replace("Decode", "")
             decoder_method_name = self.INLINE_DECODER_MAP.get(filter_name)
@@ -717,51 +794,16 @@ class EngineState:
     def set_inline_image_color_space(self, command: PdfOperator):
         self.inline_image_color_space = command
 
-    def dump_dict(self):
-        m1 = self.cm_matrix
-        m2 = self.tm_matrix
-        return {
-            # "CTM": copy.copy(self.CTM),
-            # "text_matrix": copy.copy(self.text_matrix),
-            "cm_matrix": copy.copy([m1.xx, m1.yx, m1.xy, m1.yy, m1.x0, m1.y0]),
-            "tm_matrix": copy.copy([m2.xx, m2.yx, m2.xy, m2.yy, m2.x0, m2.y0]),
-            "text_position": copy.copy(self.text_position),
-            "character_spacing": copy.copy(self.character_spacing),
-            "word_spacing": copy.copy(self.word_spacing),
-            "horizontal_scaling": copy.copy(self.horizontal_scaling),
-            "leading": copy.copy(self.leading),
-            "font_name": copy.copy(self.font.font_name) if self.font else None,
-            "font_size": copy.copy(self.font_size),
-            "text_rize": copy.copy(self.text_rize),
-            "line_width": copy.copy(self.line_width),
-            "position": copy.copy(self.position),
-            "dash_pattern": copy.copy(self.dash_pattern),
-            "stroke_color": copy.copy(self.stroke_color),
-            "fill_color": copy.copy(self.fill_color),
-            "color_space_stroke ": copy.copy(self.color_space_stroke),
-            "color_space_fill": copy.copy(self.color_space_fill),
-            "_stroke_alpha": copy.copy(self.stroke_alpha),
-            "_fill_alpha ": copy.copy(self.fill_alpha),
-            "miter_limit": copy.copy(self.miter_limit),
-            "line_cap": copy.copy(self.line_cap),
-            "line_join": copy.copy(self.line_join),
-            # inline image
-            "inline_image_width": copy.copy(self.inline_image_width),
-            "inline_image_height": copy.copy(self.inline_image_height),
-            "inline_image_bits_per_component": copy.copy(
-                self.inline_image_bits_per_component
-            ),
-            "inline_image_mask": copy.copy(self.inline_image_mask),
-            "text_rendering_mode": copy.copy(self.text_rendering_mode),
-        }
+    def dump_state(self) -> tuple:
+        return self.get_saved_state(self)
 
     def save_state(self, _: PdfOperator):
         # print("saving state")
-        self.state_stack.append(self.dump_dict())
+        self.state_stack.append(self.get_saved_state(self))
         return "", True
 
     def restore_state(
-        self, _: PdfOperator | None = None, dump: dict | None = None
+        self, _: PdfOperator | None = None, dump: tuple | None = None
     ):
         if not dump and len(self.state_stack) == 0:
             raise Exception("stack is empty")
@@ -771,20 +813,10 @@ class EngineState:
             state = self.state_stack.pop()
         else:
             state = dump
-        for key, value in state.items():
-            if key == "cm_matrix" or key == "tm_matrix":
-                setattr(self, key, Matrix(*value))
-            elif key == "font_name":
-                if value:
-                    self.font = self.font_map[value]  # if value else
-                else:
-                    self.font = None
-                    # raise Exception(
-                    #     f"font ({value}) can not be found on depth {self.depth}"
-                    # )
-
-            else:
-                setattr(self, key, value)
+        # plain attributes only (no properties), caches included
+        self.__dict__.update(zip(self.SAVED_STATE, state))
+        self.matrix_dirty = True
+        self.matrix_changes += 1
 
         # print(self.cm_matrix)
         return "", True
@@ -864,7 +896,8 @@ class EngineState:
         # args[0] = args[0] or 1
         # args[3] = args[3] or 1
 
-        args = command.args
+        # a copy, the operators of a form are replayed on every page
+        args = list(command.args)
 
         if args[0] == 0.0:  # and args[1] == 0:
             args[0] = 0.000000001  # self.scale  #
@@ -900,8 +933,7 @@ class EngineState:
         """
         x, y = [*command.args]
         # self.tm_matrix.translate(x0, y0)
-        self.tm_matrix.translate(x, y)
-        # self.tm_matrix = Matrix(1, 0, 0, 1, x, y).multiply(self.tm_matrix)
+        self.translate_text_matrix(x, y)
         self.text_position = [0.0, 0.0]
         if self.debug:
             return self.get_current_position_for_debuging(), True
@@ -917,8 +949,7 @@ class EngineState:
     def set_text_position_and_leading(self, command: PdfOperator):
         x, y = [*command.args]
         self.leading = -float(y)
-        self.tm_matrix.translate(x, y)
-        # self.tm_matrix = Matrix(1, 0, 0, 1, x, y).multiply(self.tm_matrix)
+        self.translate_text_matrix(x, y)
         self.text_position = [0.0, 0.0]
         if self.debug:
             return self.get_current_position_for_debuging(), True
@@ -936,7 +967,7 @@ class EngineState:
         return (x, y)
 
     def move_with_leading(self, _: PdfOperator):
-        self.tm_matrix.translate(0, -self.leading)
+        self.translate_text_matrix(0, -self.leading)
         self.text_position = [0, 0]
         self.updata_missing_font_count()
         if self.debug:
@@ -947,7 +978,7 @@ class EngineState:
         sw, sc = command.args
         self.character_spacing = float(sc)
         self.word_spacing = float(sw)
-        self.tm_matrix.translate(0, self.leading)
+        self.translate_text_matrix(0, self.leading)
         self.text_position = [0, 0]
         self.updata_missing_font_count()
         if self.debug:
@@ -1007,8 +1038,20 @@ class EngineState:
     def convert_em_to_ts(self, em: float):
         return em / 1000 * self.font_size
 
+    def get_dispatch_table(self) -> list:
+        """
+        table[cmd.opcode] = handler of the operator (or None), resolved
+        once per state, the last entry is the one of opcode -1
+        """
+        if self.dispatch_table is None:
+            fmap = self.functions_map
+            self.dispatch_table = [
+                fmap.get(name) for name in (*PdfOperator.OPCODE_NAMES, None)
+            ]
+        return self.dispatch_table
+
     def execute_command(self, command: PdfOperator):
-        func = self.functions_map.get(command.name)
+        func = self.get_dispatch_table()[command.opcode]
         if func:
             args_scaled, ok = func(command)
             if args_scaled:
@@ -1137,7 +1180,9 @@ class EngineState:
             "/Screen": cairo.Operator.SCREEN,
             # Add more mappings as needed
         }
-        self.ctx.set_operator(cairo_operators.get(mode, cairo.Operator.OVER))
+        self.ctx and self.ctx.set_operator(
+            cairo_operators.get(mode, cairo.Operator.OVER)
+        )
 
     def _set_soft_mask(self, cmd: PdfOperator):
         mask_def = cmd.args[0]
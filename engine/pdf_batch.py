@@ -0,0 +1,116 @@
+import json
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from os.path import sep
+
+from .pdf_engine import PdfEngine
+from .pdf_utils import igcse_path, get_pdf_hash
+
+# ************************************************************************
+# ********************** Batch Question Extraction ***********************
+# ************************************************************************
+# exams are fanned out over a process pool, every exam writes its detected
+# questions to <subject>/detected/<exam>.json (the file read by
+# pdf_gui_api.get_curr_exam_questions), and a manifest keyed on the exam id
+# keeps the pdf hash of every finished exam, so an interrupted run resumes
+# where it stopped and unchanged exams are skipped.
+
+MANIFEST_NAME = "detected-manifest.json"
+
+
+def get_exam_json_path(exam_name: str, output_root: str = igcse_path):
+    exam_id = exam_name.split(".")[0]
+    subj_id = exam_id.split("_")[0]
+    return f"{output_root}{sep}{subj_id}{sep}detected{sep}{exam_id}.json"
+
+
+def load_manifest(manifest_path: str) -> dict:
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_json_atomic(path: str, data):
+    """a crash while writing never leaves a half written file behind"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def extract_exam_questions(exam: tuple[str, str], scaling: int, backend: int):
+    """worker: returns (exam_name, list of question dicts | None, error)"""
+    exam_name = exam[0]
+    try:
+        engine = PdfEngine(scaling, backend=backend)
+        engine.set_files([exam])
+        engine.proccess_next_pdf_file()
+        q_list = engine.extract_questions_from_pdf(debug=0)
+        return exam_name, [q.__to_dict__() for q in q_list], None
+    except Exception as e:
+        return exam_name, None, f"{e}\n{traceback.format_exc()}"
+
+
+def run_batch_extraction(
+    exams: list[tuple[str, str]],
+    workers: int = 1,
+    force: bool = False,
+    output_root: str = igcse_path,
+    scaling: int = 4,
+    backend: int = PdfEngine.B_GEOMETRY_ONLY,
+):
+    """
+    exams: (exam_name, pdf_path) tuples (args.data)
+    force: re-detect the exams even if their pdf did not change
+    returns the manifest entries of this run, {exam_id: entry}
+    """
+    manifest_path = f"{output_root}{sep}{MANIFEST_NAME}"
+    manifest = load_manifest(manifest_path)
+
+    pending: dict[str, tuple[tuple[str, str], str]] = {}
+    skipped = 0
+    for exam in exams:
+        exam_id = exam[0].split(".")[0]
+        pdf_hash = get_pdf_hash(exam[1])
+        entry = manifest.get(exam_id)
+        if (
+            not force
+            and entry
+            and entry["status"] == "done"
+            and entry["hash"] == pdf_hash
+            and os.path.exists(get_exam_json_path(exam[0], output_root))
+        ):
+            skipped += 1
+            continue
+        pending[exam[0]] = (exam, pdf_hash)
+
+    print(f"exams: {len(exams)}, skipped: {skipped}, todo: {len(pending)}")
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(extract_exam_questions, exam, scaling, backend)
+            for exam, _ in pending.values()
+        ]
+        for i, future in enumerate(as_completed(futures)):
+            exam_name, questions, error = future.result()
+            exam, pdf_hash = pending[exam_name]
+            exam_id = exam_name.split(".")[0]
+            entry = {"path": exam[1], "hash": pdf_hash}
+            if error is None:
+                json_path = get_exam_json_path(exam_name, output_root)
+                write_json_atomic(json_path, questions)
+                entry.update(status="done", questions=len(questions))
+            else:
+                entry.update(status="failed", error=error)
+            manifest[exam_id] = entry
+            results[exam_id] = entry
+            # saved after every exam, a crashed run resumes from here
+            write_json_atomic(manifest_path, manifest)
+            print(
+                f"[{i + 1}/{len(pending)}] {exam_name}: {entry['status']}"
+                + (f" ({len(questions)} questions)" if questions else "")
+            )
+    return results
@@ -0,0 +1,55 @@
+import hashlib
+import mmap
+
+import fitz  # PyMuPDF library
+from pypdf import PdfReader, PageObject
+
+# ************************************************************************
+# ********************** Pdf Document Handle *****************************
+# ************************************************************************
+# a pdf file is opened (memory mapped) once, pypdf and PyMuPDF both read
+# from the same read-only buffer, nothing is copied (the os page cache is
+# the only copy, the file is read at most once, even on network drives).
+# the PyMuPDF document is only opened when a page is rasterized by fitz,
+# pypdf only parses the objects of the pages that are actually loaded.
+
+
+class PdfDocument:
+
+    def __init__(self, pdf_path: str) -> None:
+        self.path = pdf_path
+        with open(pdf_path, "rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.reader = PdfReader(self.buffer)
+        self._fitz_doc: fitz.Document | None = None
+
+    @property
+    def pages(self) -> list[PageObject]:
+        return self.reader.pages
+
+    @property
+    def fitz_doc(self) -> fitz.Document:
+        if self._fitz_doc is None:
+            # PyMuPDF keeps a reference to the memoryview (no copy)
+            self._fitz_doc = fitz.open(
+                stream=memoryview(self.buffer), filetype="pdf"
+            )
+        return self._fitz_doc
+
+    def load_fitz_page(self, page_number: int) -> fitz.Page:
+        return self.fitz_doc.load_page(page_number - 1)
+
+    def get_hash(self) -> str:
+        """same as pdf_utils.get_pdf_hash, without reading the file again"""
+        return hashlib.sha256(self.buffer).hexdigest()
+
+    def close(self):
+        if self._fitz_doc is not None:
+            self._fitz_doc.close()
+            self._fitz_doc = None
+        try:
+            self.buffer.close()
+        except BufferError:
+            # a fitz page (or pixmap) still holds a view on the buffer,
+            # the mapping is released with the last view
+            pass
@@ -1,4 +1,6 @@
 import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 import fitz  # PyMuPDF library
 import cairo
 import numpy as np
@@ -11,15 +13,19 @@ from pypdf import PdfReader, PageObject
 import pprint
 
 from detectors import question_detectors
+from detectors.core_detectors import SequenceRecorder, SymbolStream
 from engine.pdf_operator import PdfOperator
 from models.core_models import SurfaceGapsSegments, Symbol
 from models.question import Question
-from .pdf_renderer import BaseRenderer
+from .pdf_renderer import BaseRenderer, GeometryRenderer
 from .pdf_font import PdfFont
 from .engine_state import EngineState
 from .pdf_stream_parser import PDFStreamParser
 
 from .pdf_utils import crop_image_surface
+from .pdf_render_cache import PageRenderCache
+from .pdf_document import PdfDocument
+from .pdf_resources import ResourceResolver
 from detectors.question_detectors import (
     QuestionDetector,
     enable_detector_dubugging,
@@ -57,13 +63,28 @@ class PdfEngine:
     D_DETECT_IMAGES = 1 << 3
     D_DETECT_TABLES = 1 << 4
 
-    def __init__(self, scaling=1, clean: int = 0):
+    # ________________________________________________________________
+    # who produces the page raster, the page stream is always interpreted
+    # (the detectors need the text geometry), but it is only painted by
+    # cairo when cairo is the raster backend
+    B_RASTER_CAIRO = 0
+    B_RASTER_FITZ = 1  # PyMuPDF raster + text geometry
+    B_GEOMETRY_ONLY = 2  # no raster at all (render_pdf_page returns None)
+
+    # part of the render cache key, bump it whenever a change of the
+    # interpreter changes the raster or the detected sequences
+    ENGINE_VERSION = 4
+
+    def __init__(self, scaling=1, clean: int = 0, *, backend=B_RASTER_FITZ):
         self.scaling = scaling
         # self.debug = debug
         self.clean = clean
+        self.backend = backend
+        self.render_cache: PageRenderCache | None = None
         self.page_seg_dict: dict[int, SurfaceGapsSegments] = {}
         self.question_list: list[Question] = {}
         self.current_pdf_document = None
+        self.document: PdfDocument | None = None
 
     # *******************************************************
     # ****************   Engine API    **********************
@@ -100,7 +121,9 @@ class PdfEngine:
         self.detection_types = 0
         return True
 
-    def extract_questions_from_pdf(self, debug=0, clean=2):
+    def extract_questions_from_pdf(self, debug=0, clean=2, workers=1):
+        """workers > 1: the pages are rendered by a pool of worker processes,
+        the QuestionDetector still sees the pages in order (same result)"""
         (clean is not None) and self.set_clean(clean)
         (debug is not None) and self.set_debug(debug & self.M_DEBUG_DETECTOR)
         self.page_seg_dict = {}
@@ -111,14 +134,24 @@ class PdfEngine:
         if self.debug & self.M_DEBUG_DETECTOR:
             enable_detector_dubugging(self.current_pdf_document)
 
+        if workers > 1:
+            self.detect_pages_in_parallel(workers)
+            return self.finish_question_detection()
+
         for page_nr in range(1, len(self.pages) + 1):
             # if page_nr in self.page_seg_dict:
             #     continue
             surface = self.render_pdf_page(page_nr, debug=None, clean=None)
+            if surface is None:
+                # B_GEOMETRY_ONLY: questions can be detected but not drawn
+                continue
             self.page_seg_dict[page_nr] = SurfaceGapsSegments(
                 surface, gap_factor=0.1, scale=self.scaling
             )
 
+        return self.finish_question_detection()
+
+    def finish_question_detection(self):
         self.question_detector.on_finish()
         q_list = self.question_detector.get_question_list(self.pdf_path)
         if len(q_list) == 0:
@@ -127,6 +160,33 @@ class PdfEngine:
         self.question_list = q_list
         return q_list
 
+    # *******************************************************
+    # **************** Symbol Streams    ********************
+    # _______________________________________________________
+    # the detectors only see the SymSequences of the pages, once recorded
+    # (SymbolStream.save) they can be replayed into any detector without
+    # interpreting the pdf again (e.g. for tuning the QuestionDetector)
+
+    def record_symbol_streams(self) -> list[SymbolStream]:
+        recorder = SequenceRecorder(self.D_DETECT_QUESTION)
+        detectors, self.ALL_DETECTORS = self.ALL_DETECTORS, [recorder]
+        self.detection_types = self.D_DETECT_QUESTION
+        try:
+            for page_nr in range(1, len(self.pages) + 1):
+                self.render_pdf_page(page_nr, debug=None, clean=None)
+        finally:
+            self.ALL_DETECTORS = detectors
+        return recorder.pages
+
+    def extract_questions_from_streams(self, streams: list[SymbolStream]):
+        """same questions as extract_questions_from_pdf, but without any
+        page raster (render_a_question is not possible)"""
+        self.page_seg_dict = {}
+        self.question_list = []
+        self.question_detector.on_restart()
+        SequenceRecorder.replay(streams, self.question_detector)
+        return self.finish_question_detection()
+
     def render_pdf_page(self, page_number, debug=0, clean=0):
         """page_number start from 1"""
         (clean is not None) and self.set_clean(clean)
@@ -135,6 +195,23 @@ class PdfEngine:
         )
 
         self.current_page = page_number
+        cache_key = self.get_render_cache_key(page_number)
+        entry = cache_key and self.render_cache.get(cache_key)
+        if entry:
+            surface = self.replay_cached_page(entry)
+        else:
+            surface = self.interpret_pdf_page(page_number, cache_key)
+        if (
+            surface is not None
+            and not self.detection_types
+            and (self.clean & self.O_CROP_EMPTY_LINES)
+        ):
+            print("calling wrong function")
+            surface = self.remove_empty_lines_from_current_page(surface)
+
+        return surface
+
+    def interpret_pdf_page(self, page_number, cache_key=None):
         self.load_page_content(page_number)
         if self.debug & self.M_DEBUG_ORIGINAL_CONTENT:
             self.debug_original_stream()
@@ -142,44 +219,176 @@ class PdfEngine:
         # if page_number in self.page_seg_dict:
         #     surface = self.page_seg_dict[page_number].surface
         # else:
-        self.execute_page_stream()
-        if True:
-            self.doc_page: fitz = self.doc.load_page(page_number - 1)
-            # zoom = 300 / 72
-            # mat = fitz.Matrix(zoom, zoom)
-            pix = self.doc_page.get_pixmap(
-                dpi=round(72 * self.scaling), alpha=False
-            )  # matrix=mat
-            # np_array = (
-            #     np.frombuffer(pix.samples, dtype=np.uint8)
-            #     .reshape(pix.height, pix.width, 4)
-            #     .copy()
-            # )
-            # np_array[:, :, [0, 2]] = np_array[:, :, [2, 0]]
-            source_bytes = pix.samples
-            width, height = pix.width, pix.height
-            rgb_array = np.frombuffer(source_bytes, dtype=np.uint8).reshape(
-                (height, width, 3)
+        detectors = self.ALL_DETECTORS
+        if cache_key:
+            recorder = SequenceRecorder(self.D_DETECT_QUESTION)
+            self.ALL_DETECTORS = [*detectors, recorder]
+        try:
+            self.execute_page_stream()
+        finally:
+            self.ALL_DETECTORS = detectors
+        if self.backend == self.B_RASTER_FITZ:
+            surface = self.render_page_with_fitz(page_number)
+            self.renderer.surface = surface
+        elif self.backend == self.B_RASTER_CAIRO:
+            surface = self.renderer.surface
+        else:
+            surface = None
+            self.renderer.surface = None
+        if cache_key:
+            self.render_cache.put(
+                cache_key, self.dump_cached_page(surface, recorder.pages)
+            )
+        return surface
+
+    # *******************************************************
+    # **************** Render Cache      ********************
+    # _______________________________________________________
+    # a hit skips the page interpretation: the recorded sequences are
+    # replayed into the detectors and the raster is restored as is
+
+    def set_render_cache(self, cache: PageRenderCache | None):
+        self.render_cache = cache
+
+    def get_render_cache_key(self, page_number) -> str | None:
+        if self.render_cache is None:
+            return None
+        if self.debug & (
+            self.M_DEBUG_ALL_STREAM | self.M_DEBUG_ORIGINAL_CONTENT
+        ):
+            # the debug files are only written while interpreting
+            return None
+        if self.pdf_hash is None:
+            self.pdf_hash = self.document.get_hash()
+        return self.render_cache.make_key(
+            self.pdf_hash,
+            page_number,
+            self.scaling,
+            self.clean,
+            self.backend,
+            self.ENGINE_VERSION,
+        )
+
+    def dump_cached_page(self, surface, recorded_pages) -> dict:
+        entry = SymbolStream.to_arrays(recorded_pages)
+        if surface is not None:
+            surface.flush()
+            entry["raster_size"] = np.array(
+                [
+                    surface.get_width(),
+                    surface.get_height(),
+                    surface.get_stride(),
+                ]
             )
-            bgra_array = np.zeros((height, width, 4), dtype=np.uint8)
-            bgra_array[:, :, 0] = rgb_array[:, :, 2]  # Blue
-            bgra_array[:, :, 1] = rgb_array[:, :, 1]  # Green
-            bgra_array[:, :, 2] = rgb_array[:, :, 0]  # Red
-            bgra_array[:, :, 3] = 255  # Alpha (fully opaque)
+            entry["raster"] = np.frombuffer(
+                zlib.compress(surface.get_data(), 1), dtype=np.uint8
+            )
+        return entry
+
+    def replay_cached_page(self, entry: dict):
+        page = self.pages[self.current_page - 1]
+        self.scaled_page_width = page.mediabox.width * self.scaling
+        self.scaled_page_height = page.mediabox.height * self.scaling
+        self.state = None
+        self.renderer = GeometryRenderer(None, [], self.clean)
+        self.renderer.initialize(
+            int(self.scaled_page_width),
+            int(self.scaled_page_height),
+            self.current_page,
+        )
+        pages, _ = SymbolStream.from_arrays(entry)
+        for detect in self.ALL_DETECTORS:
+            if detect.id & self.D_DETECT_QUESTION:
+                SequenceRecorder.replay(pages, detect)
+        surface = None
+        if "raster" in entry:
+            width, height, stride = entry["raster_size"].tolist()
             surface = cairo.ImageSurface.create_for_data(
-                bgra_array, cairo.FORMAT_ARGB32, pix.width, pix.height
+                bytearray(zlib.decompress(entry["raster"])),
+                cairo.FORMAT_ARGB32,
+                width,
+                height,
+                stride,
             )
+        self.renderer.surface = surface
+        return surface
 
-            self.renderer.surface = surface
-        else:
-            surface = self.renderer.surface
-        if not self.detection_types and (self.clean & self.O_CROP_EMPTY_LINES):
-            print("calling wrong function")
-            surface = self.remove_empty_lines_from_current_page(surface)
+    # *******************************************************
+    # **************** Parallel Pages    ********************
+    # _______________________________________________________
+    # interpreting a page is pure python (one core), the workers render
+    # the pages and send back the recorded SymSequences + the page gaps,
+    # the (stateful) QuestionDetector replays them in page order
+
+    def detect_pages_in_parallel(self, workers: int):
+        pdf_path = (self.pdf_name, self.pdf_path)
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_page_worker,
+            initargs=(pdf_path, self.scaling, self.clean, self.backend),
+        ) as executor:
+            pages = range(1, len(self.pages) + 1)
+            # map keeps the page order
+            for page_nr, recorded, gaps in executor.map(
+                _detect_page_in_worker, pages
+            ):
+                SequenceRecorder.replay(recorded, self.question_detector)
+                if gaps is None:
+                    continue
+                empty_segments, width, height = gaps
+                self.page_seg_dict[page_nr] = (
+                    SurfaceGapsSegments.from_empty_gaps(
+                        empty_segments,
+                        width,
+                        height,
+                        lambda page_nr=page_nr: self.render_page_raster(
+                            page_nr
+                        ),
+                        gap_factor=0.1,
+                        scale=self.scaling,
+                    )
+                )
+        # the serial path leaves the renderer of the last page behind
+        # (render_a_question needs its header/footer)
+        self.renderer = GeometryRenderer(None, [], self.clean)
+        self.renderer.initialize(
+            int(self.scaled_page_width),
+            int(self.scaled_page_height),
+            len(self.pages),
+        )
 
-        return surface
+    def render_page_raster(self, page_number):
+        """the page raster only, without running the detectors"""
+        if self.backend == self.B_RASTER_FITZ:
+            return self.render_page_with_fitz(page_number)
+        detectors, self.ALL_DETECTORS = self.ALL_DETECTORS, []
+        try:
+            return self.render_pdf_page(page_number, debug=None, clean=None)
+        finally:
+            self.ALL_DETECTORS = detectors
+
+    def render_page_with_fitz(self, page_number):
+        self.doc_page: fitz = self.document.load_fitz_page(page_number)
+        pix = self.doc_page.get_pixmap(
+            dpi=round(72 * self.scaling), alpha=False
+        )
+        width, height = pix.width, pix.height
+        rgb_array = np.frombuffer(pix.samples, dtype=np.uint8).reshape(
+            (height, width, 3)
+        )
+        bgra_array = np.empty((height, width, 4), dtype=np.uint8)
+        bgra_array[:, :, 2::-1] = rgb_array  # RGB -> BGR in one copy
+        bgra_array[:, :, 3] = 255  # Alpha (fully opaque)
+        return cairo.ImageSurface.create_for_data(
+            bgra_array, cairo.FORMAT_ARGB32, width, height
+        )
+
+    def set_backend(self, backend):
+        self.backend = backend
 
     def render_a_question(self, q_nr, devide=False):
+        if not self.page_seg_dict:
+            raise Exception("questions can not be drawn without a raster")
         if not self.question_list:
             raise Exception("there is no detected Question on this exam")
         if 0 > q_nr > len(self.question_list):
@@ -200,12 +409,15 @@ class PdfEngine:
     # _______________________________________________________
 
     def initialize_file(self, pdf_path):
-        self.current_stream: str | None = None
+        self.current_stream: bytes | None = None
         self.pdf_path = pdf_path[1]
         self.current_pdf_document = self.pdf_path
         self.pdf_name = pdf_path[0]
-        self.reader: PdfReader = PdfReader(self.pdf_path)
-        self.doc = fitz.open(self.pdf_path)
+        if self.document is not None:
+            self.document.close()
+        # one (memory mapped) open of the file for pypdf and fitz
+        self.document = PdfDocument(self.pdf_path)
+        self.reader: PdfReader = self.document.reader
         first_page: PageObject = self.reader.pages[0]
         self.scaled_page_width: float = (
             float(first_page.mediabox.width) * self.scaling
@@ -217,6 +429,13 @@ class PdfEngine:
         self.line_height = Symbol.LINE_HEIGHT_FACTOR * self.scaling * self.d0
 
         self.font_map: dict[str, PdfFont] | None = None
+        self.release_font_registry()
+        # state matrix changes vs. the ones pushed to cairo (lazily)
+        self.matrix_changes = 0
+        self.matrix_syncs = 0
+        # parsed form xobjects, (idnum, generation) -> operators
+        self.form_cache: dict[tuple[int, int], list[PdfOperator]] = {}
+        self.resource_resolver = ResourceResolver(self.reader)
 
         self.question_detector: QuestionDetector = QuestionDetector(
             self.D_DETECT_QUESTION, self.scaling
@@ -226,6 +445,8 @@ class PdfEngine:
         self.state: EngineState | None = None
         self.renderer: BaseRenderer | None = None
         self.pages = self.reader.pages
+        # computed on the first render cache lookup
+        self.pdf_hash: str | None = None
 
     # *******************************************************
     # **************** Parsing Stream  **********************
@@ -249,6 +470,7 @@ class PdfEngine:
         if page_number < 1 or page_number > len(self.reader.pages):
             raise ValueError("Invalid page number")
         self.current_page = page_number
+        self.resource_resolver.set_page(page_number)
         page = self.reader.pages[page_number - 1]
         res = page.get("/Resources")
         if isinstance(res, IndirectObject):
@@ -264,22 +486,16 @@ class PdfEngine:
         self.font_map = self.get_fonts(self.res, 0)
         self.color_map = self.get_color_space_map(self.res)
 
-        streams_data: list[bytes] = self.get_page_stream_data(page)
+        streams_data: bytes = self.get_page_stream_data(page)
 
-        for i, b in enumerate(streams_data):
-            if b == 54:
-                pass
         if len(streams_data) == 0:
-            self.current_stream = pnc.bytes_to_string(
-                self.reader.stream.read()
-            )
+            self.current_stream = self.reader.stream.read()
             raise Exception(
                 "no data found in this pdf !!!",
                 self.pdf_path,
                 ":",
                 self.current_page,
             )
-        streams_data = pnc.bytes_to_string(streams_data, unicode_excape=True)
         self.current_stream = streams_data
         return self
 
@@ -330,11 +546,14 @@ class PdfEngine:
             self.print_fonts(f, res)
             self.print_external_g_state(f, res)
             self.print_color_space(f, res)
-            f.write(self.current_stream)
+            f.write(pnc.bytes_to_string(self.current_stream))
         return self
 
     def debug_x_stream(
-        self, xres: dict, xstream: str, filename=f"output{sep}xobj_stream.txt"
+        self,
+        xres: dict,
+        xstream: bytes,
+        filename=f"output{sep}xobj_stream.txt",
     ):
         # print("saving debug info into file")
         with open(filename, "w", encoding="utf-8") as f:
@@ -345,7 +564,7 @@ class PdfEngine:
             self.print_fonts(f, xres)
             self.print_external_g_state(f, xres)
             self.print_color_space(f, xres)
-            f.write(xstream)
+            f.write(pnc.bytes_to_string(xstream))
 
     def print_color_space(self, f, res):
 
@@ -395,25 +614,25 @@ class PdfEngine:
         return self.current_pdf_document
 
     def get_color_space_map(self, res):
+        return (
+            self.resource_resolver.get_category(
+                res, "/ColorSpace", self.build_color_space_map
+            )
+            or None
+        )
+
+    def build_color_space_map(self, cs):
         colorSpace = {}
-        cs = res.get("/ColorSpace")
-        if isinstance(cs, IndirectObject):
-            cs = self.reader.get_object(cs)
-        if not cs:
-            return
+        resolve = self.resource_resolver.resolve
         for key, value in cs.items():
             # if self.color_map and self.color_map.get(key):
             #     colorSpace[key] = self.color_map[key]
 
-            if isinstance(value, IndirectObject):
-                value = self.reader.get_object(value)
-            obj = value
+            obj = resolve(value)
             if isinstance(obj, list):
                 new_list = []
                 for o in obj:
-                    if isinstance(o, IndirectObject):
-                        o = self.reader.get_object(o)
-                    new_list.append(o)
+                    new_list.append(resolve(o))
 
                 colorSpace[key] = new_list
                 pass
@@ -428,36 +647,70 @@ class PdfEngine:
         if resources and resources.get("/Font"):
             for font_name, font_object in resources.get("/Font").items():
                 if font_name not in fonts:
-                    # if self.font_map and font_name in self.font_map:
-                    #     fonts[font_name] = self.font_map[font_name]
-                    # else:
-                    fonts[font_name] = PdfFont(
-                        font_name,
-                        self.reader.get_object(font_object),
-                        self.reader,
-                        self.execute_glyph_stream,
-                        depth,
+                    fonts[font_name] = self.get_registered_font(
+                        font_name, font_object, depth
                     )
         return fonts
 
+    # *******************************************************
+    # **************** Font Registry   **********************
+    # _______________________________________________________
+    # PdfFont objects are expensive (ToUnicode cmap, width map,
+    # embedded font program, freetype face), and all pages/xobjects
+    # of an exam share the same handful of fonts. the registry keeps
+    # one PdfFont per font (indirect) reference for the current file
+
+    def release_font_registry(self):
+        self.font_registry: dict[tuple[int, int], PdfFont] = {}
+        self.font_registry_hits = 0
+        self.font_registry_misses = 0
+
+    def get_registered_font(self, font_name, font_object, depth=0):
+        if not isinstance(font_object, IndirectObject):
+            # direct font dicts can not be shared between resources
+            self.font_registry_misses += 1
+            return PdfFont(
+                font_name,
+                font_object,
+                self.reader,
+                self.execute_glyph_stream,
+                depth,
+            )
+        key = (font_object.idnum, font_object.generation)
+        font = self.font_registry.get(key)
+        if font is not None:
+            self.font_registry_hits += 1
+            return font
+        self.font_registry_misses += 1
+        font = PdfFont(
+            font_name,
+            self.reader.get_object(font_object),
+            self.reader,
+            self.execute_glyph_stream,
+            depth,
+        )
+        self.font_registry[key] = font
+        return font
+
     def get_external_g_state(self, res):
-        exgtate = {}
-        ext = res.get("/ExtGState")
-        if not ext:
-            return {}
-        if isinstance(ext, IndirectObject):
-            ext = self.reader.get_object(ext)
-        for key, value in ext.items():
-            obj = self.reader.get_object(value)
-            exgtate[key] = obj
-        return exgtate
+        return (
+            self.resource_resolver.get_category(
+                res, "/ExtGState", self.resolve_entries
+            )
+            or {}
+        )
 
     def get_x_object(self, res):
-        x_obj = res.get("/XObject", {})
-        if isinstance(x_obj, IndirectObject):
-            x_obj = self.reader.get_object(x_obj)
+        return (
+            self.resource_resolver.get_category(
+                res, "/XObject", self.resolve_entries
+            )
+            or {}
+        )
 
-        return x_obj
+    def resolve_entries(self, category: dict):
+        resolve = self.resource_resolver.resolve
+        return {key: resolve(value) for key, value in category.items()}
 
     def update_sub_obj(self, key, value, output_dict, font_name):
         if isinstance(value, IndirectObject):
@@ -478,6 +731,51 @@ class PdfEngine:
     # **************** Excecute Stream **********************
     # _______________________________________________________
 
+    def execute_operators(
+        self,
+        commands,
+        state: EngineState,
+        f=None,
+        strict: bool = True,
+        where: str = "",
+    ):
+        """
+        runs the operators through state and renderer, every operator is
+        resolved by its opcode in the dispatch tables of state and renderer
+        (both are built once, the renderer's is shared by all the streams
+        of the page: forms, type3 glyphs).
+        f: debugging output, strict: raise on operators nobody handles
+        """
+        state_table = state.get_dispatch_table()
+        render_table = self.renderer.get_dispatch_table()
+        for cmd in commands:
+            opcode = cmd.opcode
+            state_func = state_table[opcode]
+            sync, render_func, shows_text = render_table[opcode]
+            f and f.write(f"{cmd}\n")
+
+            if state_func is not None:
+                args_scaled, _ = state_func(cmd)
+                if f and args_scaled:
+                    f.write(f"current position = {args_scaled}\n")
+            elif render_func is None and strict:
+                print(f"{where}CMD:", cmd)
+                s = f"{cmd.name} was not handled \n"
+                s += f"args : {cmd.args}\n"
+                raise Exception("Incomplete Implementaion\n" + s)
+
+            sync is not None and sync()
+            if render_func is not None:
+                explanation, _ = render_func(cmd)
+                f and explanation and f.write(f"{explanation}\n")
+
+            if shows_text:
+                self.counter += 1
+                f and f.write(f"counter={self.counter}\n\n")
+                if self.max_show and self.counter > self.max_show:
+                    break
+        self.matrix_changes += state.matrix_changes
+
     def execute_page_stream(self, max_show: int | None = None) -> int:
         # if (
         #     self.font_map is None
@@ -507,9 +805,14 @@ class PdfEngine:
         used_detectors = []
         for detect in self.ALL_DETECTORS:
             (detect.id & self.D_DETECT_QUESTION) and used_detectors.append(
-                self.question_detector
+                detect
             )
-        self.renderer = BaseRenderer(self.state, used_detectors, self.clean)
+        # only cairo rasterization needs the painting renderer
+        if self.backend == self.B_RASTER_CAIRO:
+            renderer_class = BaseRenderer
+        else:
+            renderer_class = GeometryRenderer
+        self.renderer = renderer_class(self.state, used_detectors, self.clean)
 
         self.state.draw_image = self.renderer.draw_inline_image
 
@@ -542,55 +845,60 @@ class PdfEngine:
 
         # ************* start Execution loop *********************
 
-        for cmd in self.parser.parse_stream(self.current_stream).iterate():
-            debugging and f.write(f"{cmd}\n")
-            explanation, ok = self.state.execute_command(cmd)
-
-            # if debugging and explanation:
-            #     f.write(f"{explanation}\n")
-
-            debugging and explanation and f.write(f"{explanation}\n")
-            explanation2, ok2 = self.renderer.execute_command(cmd)
-
-            if debugging and explanation2:
-                f.write(f"{explanation2}\n")
-
-            if cmd.name in ["Tj", "TJ", "'", '"']:
-                self.counter += 1
-                if debugging:
-                    f.write(f"counter={self.counter}\n\n")
-
-            if max_show and self.counter > max_show:
-                break
-
-            if debugging and not ok and not ok2:
-                print("CMD:", cmd)
-                s = f"{cmd.name} was not handled \n"
-                s += f"args : {cmd.args}\n"
-                raise Exception("Incomplete Implementaion\n" + s)
+        self.execute_operators(
+            self.parser.parse_stream(self.current_stream).iterate(),
+            self.state,
+            f,
+            strict=bool(debugging),
+        )
+        self.matrix_syncs += self.renderer.matrix_syncs
 
         if debugging:
             f.flush()
             f.close()
 
+    def get_form_operators(self, xobj) -> list[PdfOperator]:
+        """
+        headers, logos and margin notes are the same form xobject on every
+        page, a form is decoded and parsed only once per document, every
+        other Do replays the operators (the handlers must not modify their
+        args, they are shared by all the pages)
+        """
+        ref = getattr(xobj, "indirect_reference", None)
+        key = (ref.idnum, ref.generation) if ref is not None else None
+        operators = self.form_cache.get(key) if key is not None else None
+        if operators is not None:
+            return operators
+        x_stream = xobj.get_data()
+        if x_stream is None:
+            raise ValueError("Engine not initialized properly")
+        operators = list(PDFStreamParser().parse_stream(x_stream).iterate())
+        if key is not None:
+            self.form_cache[key] = operators
+        return operators
+
     def execute_xobject_stream(
         self,
-        data_stream: str,
-        initial_state: dict,
-        xres: dict,
+        xobj,
+        parent_res: dict,
+        initial_state: tuple,
         depth: int,
         stream_name,
     ):
 
-        x_stream = data_stream
         debugging = (
             # not self.detection_types and
             self.debug
             & self.M_DEBUG_XOBJECT_STREAM
         )
 
+        # the resources depend on the caller, the operators do not
+        xres = EngineState.merge_resources(
+            parent_res, xobj.get("/Resources", {})
+        )
+        x_commands = self.get_form_operators(xobj)
         if debugging:
-            self.debug_x_stream(xres, x_stream)
+            self.debug_x_stream(xres, xobj.get_data())
         x_font_map = self.get_fonts(xres, depth)
         x_state: EngineState | None = None
         x_exgtate = self.get_external_g_state(xres)
@@ -614,12 +922,8 @@ class PdfEngine:
         old_state = self.renderer.state
         self.renderer.state = x_state
 
-        if x_font_map is None or x_stream is None:
-            raise ValueError("Engine not initialized properly")
-
         x_state.ctx = self.renderer.ctx
 
-        x_parser = PDFStreamParser()
         f = None
         if debugging:
             if not self.output_file:
@@ -631,27 +935,7 @@ class PdfEngine:
             f.write(f"X_Stream[{depth}]: {stream_name}" + "\n")
             f.write("Enter: " + "\n\n\n")
 
-        for cmd in x_parser.parse_stream(x_stream).iterate():
-            debugging and f.write(f"{cmd}\n")
-            explanation, ok = x_state.execute_command(cmd)
-            if debugging and explanation:
-                f.write(f"{explanation}\n")
-            explanation2, ok2 = self.renderer.execute_command(cmd)
-
-            (debugging and explanation2) and f.write(f"{explanation}\n")
-            if cmd.name in ["Tj", "TJ", "'", '"']:
-                self.counter += 1
-                debugging and f.write("\n\n")
-
-            if self.max_show and self.counter > self.max_show:
-                break
-
-            if not ok and not ok2:
-                print("X_CMD:", cmd)
-                print("Inside XFORM :")
-                s = f"{cmd.name} was not handled \n"
-                s += f"args : {cmd.args}\n"
-                raise Exception("Incomplete Implementaion\n" + s)
+        self.execute_operators(x_commands, x_state, f, where="X_")
 
         if debugging:
             f.write("\n\n")
@@ -661,7 +945,7 @@ class PdfEngine:
         self.renderer.state = old_state
 
     def execute_glyph_stream(
-        self, stream: str, ctx: cairo.Context, char_name: str, font_matrix
+        self, stream: bytes, ctx: cairo.Context, char_name: str, font_matrix
     ):
 
         debugging = (
@@ -674,7 +958,7 @@ class PdfEngine:
                 f"output{sep}font_stream.txt", "w", encoding="utf-8"
             ) as f:
                 f.write("# page number " + str(self.current_page) + "\n\n")
-                f.write(stream)
+                f.write(pnc.bytes_to_string(stream))
 
         font_state = EngineState(
             font_map=self.font_map,
@@ -719,24 +1003,12 @@ class PdfEngine:
             f.write(f"Font_Stream[{self.state.depth}]: {char_name}" + "\n")
             f.write("Enter: " + "\n\n\n")
         print("\n\nEnter Font_Stream\n")
-        for cmd in x_parser.parse_stream(stream).iterate():
-            debugging and f.write(f"{cmd}\n")
-            explanation, ok = font_state.execute_command(cmd)
-            if debugging and explanation:
-                f.write(f"{explanation}\n")
-            explanation2, ok2 = self.renderer.execute_command(cmd)
-            if debugging and explanation2:
-                f.write(f"{explanation}\n")
-            if cmd.name in ["Tj", "TJ", "'", '"']:
-                debugging and f.write("\n\n")
-                self.counter += 1
-
-            if not ok and not ok2:
-                print("Font_CMD:", cmd)
-                print("Inside Font_State :")
-                s = f"{cmd.name} was not handled \n"
-                s += f"args : {cmd.args}\n"
-                raise Exception("Incomplete Implementaion\n" + s)
+        self.execute_operators(
+            x_parser.parse_stream(stream).iterate(),
+            font_state,
+            f,
+            where="Font_",
+        )
 
         if debugging:
             f.write("\n\n")
@@ -797,6 +1069,36 @@ class PdfEngine:
         return crop_image_surface(out_surf, start_y, last_y, padding)
 
 
+# ************************************************************
+# ************** Page Worker (one engine per process) ********
+
+_page_worker_engine: PdfEngine | None = None
+
+
+def _init_page_worker(pdf_path, scaling, clean, backend):
+    global _page_worker_engine
+    engine = PdfEngine(scaling, clean, backend=backend)
+    engine.initialize_file(pdf_path)
+    engine.set_debug(0)
+    engine.detection_types = PdfEngine.D_DETECT_QUESTION
+    _page_worker_engine = engine
+
+
+def _detect_page_in_worker(page_nr: int):
+    """returns (page_nr, recorded sequences, (gaps, width, height) | None)"""
+    engine = _page_worker_engine
+    recorder = SequenceRecorder(PdfEngine.D_DETECT_QUESTION)
+    engine.ALL_DETECTORS = [recorder]
+    surface = engine.render_pdf_page(page_nr, debug=None, clean=None)
+    gaps = None
+    if surface is not None:
+        segments = SurfaceGapsSegments(
+            surface, gap_factor=0.1, scale=engine.scaling
+        )
+        gaps = (segments.empty_segments, segments.width, segments.height)
+    return page_nr, recorder.pages, gaps
+
+
 if __name__ == "__main__":
     pdf_path = "9702_m23_qp_12.pdf"
     pdf_engine = PdfEngine(pdf_path)
@@ -1,5 +1,7 @@
 from math import isnan
 from pathlib import Path
+from collections import OrderedDict
+import io
 import os
 import platform
 import re
@@ -14,7 +16,10 @@ from pypdf import PdfReader
 
 from .pdf_utils import open_image_in_irfan, kill_with_taskkill
 from engine import winansi
-from .create_cairo_font import create_cairo_font_face_for_file
+from .create_cairo_font import (
+    create_cairo_font_face_for_file,
+    create_cairo_font_face_for_memory,
+)
 import pprint
 
 # from fontTools.ttLib import TTFont
@@ -51,6 +56,7 @@ class PdfFont:
     TYPE1 = ["/Type1", "/TrueType"]
     TYPE3 = ["/Type3"]
     SUPPORTED_TYPES = ["/Type0", "/Type1", "/TrueType", "/Type3"]
+    SCALED_FONTS_CACHE_SIZE = 32
     FONT_DIR = Path(f".{sep}Fonts")
     SYSTEM_FONTS = None
 
@@ -129,9 +135,11 @@ class PdfFont:
         # ************ FONT DATA VARS *********************
         # ------------ TYPE0 , TYPE1
         self.font_face = None
+        self.scaled_fonts: OrderedDict[tuple, cairo.ScaledFont] = OrderedDict()
         self.ft_encoding, self.ft_face = None, None
         self.has_char_map = False
         self.font_path = None
+        self.font_data: bytes | None = None
         self.cid_to_gid = {}
         self.char_to_gid = {}
         self.symbol_to_gid = {}
@@ -142,6 +150,11 @@ class PdfFont:
             *font_dict.get("/FontMatrix", [0.001, 0, 0, 0.001, 0, 0])
         )
         self.glyph_cache = {}
+        # ------------ Glyph lookup tables ----------------------------
+        # char_code -> (glyph_id, width, text), filled on first use
+        # dense table for simple fonts (1 byte codes), dict for type0 CIDs
+        self.glyph_info_table: list[tuple | None] = [None] * 256
+        self.glyph_info_map: dict[int, tuple] = {}
         # ------------ Embeded Font File ----------------------------
         # for :  typ1,type0,TrueType,OpenType
         # -------------
@@ -227,9 +240,9 @@ class PdfFont:
                 # -----------
 
                 font_file = self.font_desc[font_file_key]
-                font_path = self.save_embeded_font_to_file(font_file, reader)
-                ft_face = freetype.Face(font_path)
-                self.font_path = font_path
+                font_data = self.load_embeded_font_data(font_file, reader)
+                ft_face = freetype.Face(io.BytesIO(font_data))
+                self.font_data = font_data
                 self.ft_face = ft_face
                 if not self.is_type0:
                     self.select_char_map_for_font()
@@ -238,7 +251,7 @@ class PdfFont:
                         self.cid_to_gid,
                         self.char_to_gid,
                         self.symbol_to_gid,
-                    ) = self.create_glyph_map_dicts(font_path)
+                    ) = self.create_glyph_map_dicts()
 
         if not_found:
 
@@ -277,24 +290,12 @@ class PdfFont:
     # *************** Helper Methods *******************
     # --------------------------------------------------
 
-    def save_embeded_font_to_file(self, font_file, reader):
-        temp_dir = "temp"
-        font_path = (
-            temp_dir + sep + self.font_name + "_" + str(self.depth) + ".ttf"
-        )
-        if not os.path.exists(temp_dir):
-            os.mkdir(temp_dir)
-        elif os.path.exists(font_path):
-            os.remove(font_path)
-
+    def load_embeded_font_data(self, font_file, reader) -> bytes:
+        """the (decoded) embedded font program, fonts are loaded from
+        memory, nothing is written to disk"""
         if isinstance(font_file, IndirectObject):
             font_file = reader.get_object(font_file)
-        font_data = font_file.get_data()
-        file = open(font_path, "bw")
-        file.write(font_data)
-        file.flush()
-        file.close()
-        return font_path
+        return font_file.get_data()
 
     def select_char_map_for_font(self):
         if not self.is_type0 and len(self.ft_face.charmaps) > 0:
@@ -327,12 +328,52 @@ class PdfFont:
         return False
 
     def get_cairo_font_face(self):
-        """Get a Cairo font face from the embedded font if available"""
-        self.font_face = create_cairo_font_face_for_file(
-            self.font_path, encoding=self.ft_encoding
-        )
+        """Get a Cairo font face from the embedded font if available,
+        the face is created once per font"""
+        if self.font_face is not None:
+            return self.font_face
+        if self.font_data is not None:
+            self.font_face = create_cairo_font_face_for_memory(
+                self.font_data, self.base_font, encoding=self.ft_encoding
+            )
+        else:
+            self.font_face = create_cairo_font_face_for_file(
+                self.font_path, encoding=self.ft_encoding
+            )
+        return self.font_face
+
+    def get_toy_font_face(self):
+        if self.font_face is None:
+            self.font_face = cairo.ToyFontFace(
+                self.font_family, self.slant, self.weight
+            )
         return self.font_face
 
+    def get_scaled_font(
+        self,
+        font_face: cairo.FontFace,
+        font_size: float,
+        ctm: cairo.Matrix,
+        options: cairo.FontOptions,
+    ) -> cairo.ScaledFont:
+        """ScaledFont for (size, ctm), kept in a small LRU cache.
+        the translation part of the ctm does not affect the scaled font"""
+        key = (font_size, ctm.xx, ctm.yx, ctm.xy, ctm.yy)
+        scaled_font = self.scaled_fonts.get(key)
+        if scaled_font is not None:
+            self.scaled_fonts.move_to_end(key)
+            return scaled_font
+        scaled_font = cairo.ScaledFont(
+            font_face,
+            cairo.Matrix(font_size, 0, 0, font_size, 0, 0),
+            cairo.Matrix(ctm.xx, ctm.yx, ctm.xy, ctm.yy, 0, 0),
+            options,
+        )
+        self.scaled_fonts[key] = scaled_font
+        if len(self.scaled_fonts) > self.SCALED_FONTS_CACHE_SIZE:
+            self.scaled_fonts.popitem(last=False)
+        return scaled_font
+
     #
     # **************************************************************
     # **************** Create some Usefull Dict ********************
@@ -474,7 +515,7 @@ class PdfFont:
             tokens.append("".join(current))
         return tokens
 
-    def create_glyph_map_dicts(self, font_path):
+    def create_glyph_map_dicts(self):
         char_to_gid = {}
         symbol_to_gid = {}
         code_to_gid = {}
@@ -542,6 +583,52 @@ class PdfFont:
             char_code = (high_byte << 8) | low_byte
         return char_code
 
+    def get_glyph_info(self, char_code: int):
+        """(glyph_id, width (in glyph space units), text) for char_code"""
+        if self.is_type0:
+            info = self.glyph_info_map.get(char_code)
+            if info is None:
+                info = self.create_glyph_info(char_code)
+                self.glyph_info_map[char_code] = info
+        else:
+            info = self.glyph_info_table[char_code]
+            if info is None:
+                info = self.create_glyph_info(char_code)
+                self.glyph_info_table[char_code] = info
+        return info
+
+    def create_glyph_info(self, char_code: int):
+        if self.is_type0:
+            char = chr(char_code >> 8) + chr(char_code & 0xFF)
+        else:
+            char = chr(char_code)
+        char_width = self.get_char_width_from_code(char_code)
+        glyph_id, glyph_name = self.get_glyph_id_from_char_code(char_code)
+
+        char_uni = None
+        if self.cid_to_unicode:
+            char_uni = self.cid_to_unicode.get(char_code)
+        elif self.is_type0:
+            # print("WARN: typ0 font without toUnicode map !!")
+            char_uni = chr(char_code)
+        if char_width is None:
+            print(
+                "is_composite:",
+                self.is_type0,
+                "symbol:",
+                glyph_name,
+                "char: ",
+                char,
+                "glyph_id",
+                glyph_id,
+                "char_code",
+                char_code,
+                "all_widths",
+                self.widths,
+            )
+            raise Exception("char width is None")
+        return glyph_id, char_width, (char_uni or char)
+
     def get_char_width_from_code(self, char_code: int):
         if isinstance(self.widths, (int, float)):
             return self.widths
@@ -671,8 +758,7 @@ class PdfFont:
 
     def render_glyph_for_type3_font(self, char_name, fill_color):
         # char_name = self.get_symbol_name_from_char_code(char_code)
-        stream_bytes = self.char_procs[char_name].get_data()
-        stream = pnc.bytes_to_string(stream_bytes, unicode_excape=True)
+        stream = self.char_procs[char_name].get_data()
         bbox = self.font_dict.get("/FontBBox", [0, 0, 1000, 1000])
         print("bbox", bbox)
         print("font_matrix", self.font_matrix)
@@ -759,7 +845,7 @@ class PdfFont:
                 self.cid_to_gid,
                 self.char_to_gid,
                 self.symbol_to_gid,
-            ) = self.create_glyph_map_dicts(self.font_path)
+            ) = self.create_glyph_map_dicts()
         pass
 
     FONT_SUBSTITUTION_MAP = {
@@ -823,7 +909,7 @@ class PdfFont:
                 self.cid_to_gid,
                 self.char_to_gid,
                 self.symbol_to_gid,
-            ) = self.create_glyph_map_dicts(self.font_path)
+            ) = self.create_glyph_map_dicts()
 
             curr_dict = (
                 self.cid_to_gid if not self.is_type0 else self.cid_to_unicode
@@ -1,4 +1,9 @@
 class PdfOperator:
+    """a single content-stream operator with its operands.
+    kept as small as possible (there are hundreds of thousands per exam),
+    the human readable explanation is only built on demand"""
+
+    __slots__ = ("name", "args", "opcode")
 
     NEED_SCALING = 0x01
     NEED_TRANSLATION = 0x02
@@ -6,24 +11,21 @@ class PdfOperator:
     def __init__(self, op_name, arguements: list):
         self.name = op_name
         self.args = arguements
+        self.opcode = PdfOperator.OPCODES.get(op_name, -1)
 
-        args_string = list(map(str, arguements))
-        context = {f"operands{i}": str(op) for i, op in enumerate(arguements)}
-        context["operands"] = ", ".join(args_string)
-        explaination = self.OPERATORS.get(op_name)
-        # if explaination:  # print(context)
+    @property
+    def explaination(self):
         try:
-            # print(explaination)
-            self.explaination = explaination % context
+            return self.get_explanation(*self.args)
         except Exception as e:
             print("ERROR: while parsing operator")
-            print(op_name, arguements, "\n\n")
+            print(self.name, self.args, "\n\n")
             raise ValueError(e)
 
     def get_explanation(self, *args):
 
-        args_string = list(map(str, args))
-        context = {f"operands{i}": str(op) for i, op in enumerate(args)}
+        args_string = list(map(self.operand_to_string, args))
+        context = {f"operands{i}": op for i, op in enumerate(args_string)}
         context["operands"] = ", ".join(args_string)
         explaination = PdfOperator.OPERATORS.get(self.name)
         if explaination:
@@ -31,6 +33,25 @@ class PdfOperator:
 
         return "Operator not found"
 
+    @staticmethod
+    def operand_to_string(op):
+        """string/image operands are raw bytes (or memoryview slices of
+        the content stream), show them as latin1 text"""
+        if isinstance(op, (bytes, bytearray, memoryview)):
+            return bytes(op).decode("latin1")
+        if isinstance(op, list):
+            return str(
+                [
+                    (
+                        bytes(o).decode("latin1")
+                        if isinstance(o, (bytes, bytearray, memoryview))
+                        else o
+                    )
+                    for o in op
+                ]
+            )
+        return str(op)
+
     def __str__(self):
         return f"{self.name} // {self.explaination}"
 
@@ -272,3 +293,7 @@ class PdfOperator:
         | PATH_OPERATORS_SET
         | INLINE_IMAGE_OPERATORS_SET
     )
+
+    # integer opcode per operator, stable for a given OPERTORS_SET
+    OPCODE_NAMES = tuple(sorted(OPERTORS_SET))
+    OPCODES = {name: code for code, name in enumerate(OPCODE_NAMES)}
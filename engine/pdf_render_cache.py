@@ -0,0 +1,107 @@
+import hashlib
+import os
+from collections import OrderedDict
+from os.path import sep
+
+import numpy as np
+
+# ************************************************************************
+# ********************** Page Render Cache *******************************
+# ************************************************************************
+# content addressed: the file name of an entry is the hash of
+# (pdf content hash, page, scaling, clean flags, backend, engine version),
+# so a changed pdf or a new engine version never hits an old entry.
+# an entry is a .npz of named arrays: the (zlib compressed) ARGB32 raster
+# and the columns of the recorded SymbolStreams of the page. no pickle,
+# entries are loaded with allow_pickle=False (the cache directory is given
+# on the command line, loading an entry never runs code).
+# the least recently used entries are removed once max_bytes is exceeded,
+# the file mtime is the "last used" time (survives between runs).
+
+ENTRY_EXTENSION = ".npz"
+
+
+class PageRenderCache:
+
+    def __init__(self, cache_dir: str, max_bytes: int = 2 << 30) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        # key -> entry size, least recently used first
+        self.index: OrderedDict[str, int] = OrderedDict()
+        self.total_bytes = 0
+        entries = []
+        for f in os.listdir(cache_dir):
+            if not f.endswith(ENTRY_EXTENSION):
+                continue
+            stat = os.stat(f"{cache_dir}{sep}{f}")
+            entries.append((stat.st_mtime, f[: -len(ENTRY_EXTENSION)], stat))
+        for _, key, stat in sorted(entries):
+            self.index[key] = stat.st_size
+            self.total_bytes += stat.st_size
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return hashlib.sha256(
+            ":".join(str(p) for p in parts).encode()
+        ).hexdigest()
+
+    def get_entry_path(self, key: str):
+        return f"{self.cache_dir}{sep}{key}{ENTRY_EXTENSION}"
+
+    def __contains__(self, key: str):
+        """cheap existence check, no disk access"""
+        return key in self.index
+
+    def get(self, key: str) -> dict[str, np.ndarray] | None:
+        if key not in self.index:
+            self.misses += 1
+            return None
+        path = self.get_entry_path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                entry = {name: data[name] for name in data.files}
+        except Exception:
+            # removed by another process, truncated or not an npz file
+            self.remove(key)
+            self.misses += 1
+            return None
+        os.utime(path)
+        self.index.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, entry: dict[str, np.ndarray]):
+        path = self.get_entry_path(key)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            # the raster is already compressed
+            np.savez(f, **entry)
+        os.replace(tmp_path, path)
+        if key in self.index:
+            self.total_bytes -= self.index.pop(key)
+        size = os.path.getsize(path)
+        self.index[key] = size
+        self.total_bytes += size
+        self.evict()
+
+    def remove(self, key: str):
+        size = self.index.pop(key, None)
+        if size is None:
+            return
+        self.total_bytes -= size
+        try:
+            os.remove(self.get_entry_path(key))
+        except OSError:
+            pass
+
+    def evict(self):
+        while self.total_bytes > self.max_bytes and len(self.index) > 1:
+            oldest = next(iter(self.index))
+            self.remove(oldest)
+
+    def clear(self):
+        for key in list(self.index):
+            self.remove(key)
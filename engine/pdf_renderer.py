@@ -7,8 +7,10 @@ from .engine_state import EngineState
 import cairo
 from cairo import Context, Glyph, ImageSurface, Matrix
 import os
+import numpy as np
 from detectors.core_detectors import BaseDetector
-from models.core_models import SymSequence, Symbol
+from models.core_models import SymSequence, Symbol, SymbolTable
+from .pdf_utils import image_data_to_bgra, image_data_to_bgra_legacy
 
 SEP = os.path.sep
 
@@ -19,6 +21,9 @@ class BaseRenderer:
 
     O_CLEAN_DOTS_LINES = 1 << 1
     O_CLEAN_HEADER_FOOTER = 1 << 2
+    # False: only the text geometry (SymSequences) is produced
+    paint = True
+    TEXT_SHOWING_OPERATORS = ("Tj", "TJ", "'", '"')
 
     def __init__(
         self,
@@ -37,6 +42,8 @@ class BaseRenderer:
         self.page_number = -1
         self.detector_list: list[BaseDetector] = detector_lists
         self.output = None
+        # the symbols of the current page, the SymSequences are views on it
+        self.symbol_table = SymbolTable()
 
         self.functions_map = {
             "TJ": self.draw_string_array,
@@ -73,27 +80,39 @@ class BaseRenderer:
             "i": lambda x: ("", True),  # not supported by cairo
         }
 
+        # the ctm of cairo is only updated (if the state matrix changed)
+        # right before an operator that uses it: paths, text and images
+        self.matrix_syncs = 0
         self.sync_functions_map = [
             #     ( [ "cs", "CS", "k", "K", "g", "G", "rg", "RG", "sc", "SC", "scn", "SCN", ], self.sync_color,),
             (
                 [
-                    "Tm",
-                    "cm",
-                    "BT",
-                    "ET",
-                    "Q",
-                    "Td",
-                    "TD",
-                    "T*",
-                    "'",
-                    '"',
-                    "Tz",
-                    "Ts",
-                    "Tf",
+                    *self.TEXT_SHOWING_OPERATORS,
+                    "m",
+                    "l",
+                    "c",
+                    "v",
+                    "y",
+                    "re",
+                    "h",
+                    "f",
+                    "f*",
+                    "S",
+                    "s",
+                    "B",
+                    "B*",
+                    "b",
+                    "b*",
+                    "W",
+                    "W*",
+                    "n",
+                    "ID",
                 ],
-                self.sync_matrix,
+                self.sync_matrix_if_dirty,
             )
         ]
+        # built on first use (subclasses may replace the maps above)
+        self.dispatch_table: list[tuple] | None = None
         self.RT_MAP = {
             0: lambda x: self.fill_path(None),
             1: lambda x: self.stroke_path(
@@ -109,6 +128,10 @@ class BaseRenderer:
 
     def initialize(self, width: int, height: int, page: int) -> None:
         """Initialize the Cairo surface and context."""
+        global doty
+        # the last dots line must not leak into the next page, pages can be
+        # rendered out of order (in worker processes)
+        doty = -30
         self.width = width
         self.height = height
         for detector in self.detector_list:
@@ -116,11 +139,20 @@ class BaseRenderer:
         self.page_number = page
         self.footer_y = height * 0.93
         self.header_y = height * 0.065
+        self.symbol_table = SymbolTable()
+        if not self.paint:
+            # headless (GeometryRenderer), no page surface is allocated
+            self.surface = None
+            self.ctx = None
+            return
         self.surface = cairo.ImageSurface(
             cairo.FORMAT_ARGB32, self.width, self.height
         )
         # self.surface.set_device_scale(3.0, 3.0)  # Doubles the effective resolution
         self.ctx = cairo.Context(self.surface)
+        # what ctx.get_scaled_font() would use (surface merged with ctx)
+        self.font_options = self.surface.get_font_options()
+        self.font_options.merge(self.ctx.get_font_options())
         self.ctx.set_source_rgb(1, 1, 1)  # White
         self.ctx.paint()
         self.ctx.set_source_rgb(0, 0, 0)  # Black
@@ -221,7 +253,8 @@ class BaseRenderer:
             return True
         dot = "."
         is_dot_only = (
-            len([sym for sym in char_seq if dot in sym.ch]) > self.max_dots
+            len([ch for ch in char_seq.get_chars() if dot in ch])
+            > self.max_dots
         )
         if is_dot_only:
             doty = sym.y
@@ -267,7 +300,7 @@ class BaseRenderer:
         # if self.mode == 1:
         self.run_detectors(char_seq)
 
-        if not self.state.font.is_type3:
+        if self.paint and not self.state.font.is_type3:
             self.draw_glyph_array(glyph_array)
         update_text_position()
         # if self.output:
@@ -303,34 +336,39 @@ class BaseRenderer:
         # char_regex1 = r"(?:\\(?P<symbol>\d{3}))|(?P<char>.)"
         # char_regex1 = r"(?:\\(?P<symbol>\d{3}))|(?P<char>.)"
 
-        if font.use_toy_font:
-            face = cairo.ToyFontFace(font.font_family, font.slant, font.weight)
-            option = cairo.FontOptions()
-            scaled_font = cairo.ScaledFont(
-                face, Matrix(), self.ctx.get_matrix(), option
-            )
-            self.ctx.set_scaled_font(scaled_font)
-            pass
+        scaled_font = None
+        paint = self.paint
+        if not paint:
+            """only the geometry (Symbols) is needed, no cairo font/ctx"""
         elif font.is_type3:
             """do not do anything !!"""
-            pass
+            self.ctx.set_font_size(font_size)
         else:
-            try:
-                cairo_font_face = font.get_cairo_font_face()
-                self.ctx.set_font_face(cairo_font_face)
-            except Exception as e:
-                pass
-                print(f"Error loading embedded font face: {e}")
-                raise Exception(f"Error loading embedded font face: {e}")
-
-        self.ctx.set_font_size(font_size)
-        scaled_font = self.ctx.get_scaled_font()
+            if font.use_toy_font:
+                cairo_font_face = font.get_toy_font_face()
+            else:
+                try:
+                    cairo_font_face = font.get_cairo_font_face()
+                except Exception as e:
+                    pass
+                    print(f"Error loading embedded font face: {e}")
+                    raise Exception(f"Error loading embedded font face: {e}")
+            # cached per (font, size, ctm), avoid re-creating the face and
+            # the scaled font on every text-show operator
+            scaled_font = font.get_scaled_font(
+                cairo_font_face,
+                font_size,
+                self.ctx.get_matrix(),
+                self.font_options,
+            )
+            self.ctx.set_scaled_font(scaled_font)
         default_char_spacing = state.character_spacing
         word_spacing = state.word_spacing
 
         m_c = self.state.get_current_matrix()
+        get_glyph_info = font.get_glyph_info
         glyph_array = []
-        char_array = []
+        symbol_rows = []
         # is_prev_element_number_or_none = True
 
         for element in text_array:
@@ -340,21 +378,19 @@ class BaseRenderer:
                 x -= dx
                 # is_prev_element_number_or_none = True
                 continue
-            elif isinstance(element, str):
+            elif isinstance(element, (bytes, memoryview)):
                 i = 0
                 while i < len(element):
-                    char = element[i]
+                    char_code = element[i]
                     if font.is_type0:
                         # TODO: handle 2 byte as one char , similarly modify the logic for handling symbol
-                        if i == len(element) - 1:
-                            char = "\x00" + char
-                        else:
-                            char = char + element[i + 1]
+                        if i < len(element) - 1:
+                            char_code = (char_code << 8) | element[i + 1]
                         i += 1
                     i += 1
-                    glyph_id, char_width, char = self.get_glyph_id_for_char(
-                        char
-                    )
+                    glyph_id, char_width, char = get_glyph_info(char_code)
+                    # same as state.convert_em_to_ts
+                    char_width = char_width / 1000 * font_size
 
                     if glyph_id is None:
                         continue
@@ -369,7 +405,9 @@ class BaseRenderer:
                     #     x += char_width
                     #     continue
 
-                    if font.use_toy_font:
+                    if not paint:
+                        glyph_array.append(glyph_id)
+                    elif font.use_toy_font:
                         char = pnc.int_to_char(glyph_id)
                         glyph_obj = scaled_font.text_to_glyphs(
                             x, y, char, False
@@ -383,7 +421,7 @@ class BaseRenderer:
                     x0, y0 = m_c.transform_point(x, y)
                     w, h = m_c.transform_distance(char_width, char_width)
                     # if char != "\u0003":
-                    char_array.append(Symbol(char, x0, y0, w, h))
+                    symbol_rows.append((char, x0, y0, w, h))
                     x += char_width + default_char_spacing
 
                     # is_prev_element_number_or_none = False
@@ -402,53 +440,15 @@ class BaseRenderer:
         if len(glyph_array) == 0:
             return None, None, update_on_finish
 
-        return glyph_array, SymSequence(char_array), update_on_finish
-
-    def get_glyph_id_for_char(self, char):
-        font = self.state.font
-
-        # +++++++++++++++ for DEBUG ******************
-        # if not is_symbol and not char:  # check for empty match
-        #     return None, None, None
-        # if is_symbol and not symbol:  # check for empty match
-        #     return None, None, None
-        # if font.is_type0:
-        #     if not is_symbol or not symbol or not prev_symbol:
-        #         raise Exception("missing symbol[prev] for composite font")
-        # ************** END DEBUG ********************
-
-        char_code = font.get_char_code_from_match(char)
-        char_width = font.get_char_width_from_code(char_code)
-        glyph_id, glyph_name = font.get_glyph_id_from_char_code(char_code)
-
-        char_uni = None
-        if font.cid_to_unicode:
-            char_uni = font.cid_to_unicode.get(char_code)
-            # print("char_uni", char_uni)
-        elif font.is_type0:
-            # print("WARN: typ0 font without toUnicode map !!")
-            char_uni = chr(char_code)
-            # raise Exception("")
-        if char_width is None:
-            pass
-            print(
-                "is_composite:",
-                font.is_type0,
-                "symbol:",
-                glyph_name,
-                "char: ",
-                char,
-                "glyph_id",
-                glyph_id,
-                "char_code",
-                char_code,
-                "all_widths",
-                font.widths,
-            )
-            raise Exception("char width is None")
-
-        char_width = self.state.convert_em_to_ts(char_width)
-        return glyph_id, char_width, (char_uni or char)
+        return (
+            glyph_array,
+            SymSequence.from_table(
+                self.symbol_table,
+                self.symbol_table.extend(symbol_rows),
+                font.base_font,
+            ),
+            update_on_finish,
+        )
 
     def draw_glyph_array_old(self, glyph_array):
         self.ctx.save()
@@ -624,115 +624,30 @@ class BaseRenderer:
         height = self.state.inline_image_height
         # is_mask = self.state.inline_image_mask
 
+        fill_color = self.state.fill_color
+        bgra = image_data_to_bgra(
+            data, width, height, bits_per_component, color_cs, fill_color
+        )
+        if bgra is None:
+            bgra = image_data_to_bgra_legacy(
+                data, width, height, bits_per_component, color_cs, fill_color
+            )
+
         surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
-        surface_data = surface.get_data()
         stride = surface.get_stride()
-
-        if bits_per_component == 1:
-            # print("is 1 bit")
-            fill_color = self.state.fill_color
-            r, g, b = [int(c) for c in fill_color]
-
-            for y in range(height):
-                for x in range(width):
-                    byte_index = (y * width + x) // 8
-                    bit_index = 7 - ((y * width + x) % 8)
-
-                    if byte_index < len(data):
-                        bit_value = (data[byte_index] >> bit_index) & 1
-                        idx = y * stride + x * 4
-
-                        if bit_value == 0:  # Black pixel
-                            surface_data[idx] = b  # Blue
-                            surface_data[idx + 1] = g  # Green
-                            surface_data[idx + 2] = r  # Red
-                            surface_data[idx + 3] = 255  # Alpha
-                        else:
-                            surface_data[idx] = 0  # Blue
-                            surface_data[idx + 1] = 0  # Green
-                            surface_data[idx + 2] = 0  # Red
-                            surface_data[idx + 3] = 0  # Alpha (transparent)
-        else:
-            # Handle regular image case
-
-            bytes_per_pixel = bits_per_component // 8
-
-            if bytes_per_pixel == 0:
-                bytes_per_pixel = 1
-
-            for y in range(height):
-                for x in range(width):
-                    idx_out = y * stride + x * 4
-                    idx_in = (y * width + x) * bytes_per_pixel
-
-                    if idx_in + bytes_per_pixel <= len(data):
-                        # Read pixel value based on bits_per_component
-                        if (
-                            bits_per_component <= 8
-                        ):  # assume that its always == 8 (< 8 not supported)
-                            if color_cs == "/DeviceGray":
-                                pixel = data[idx_in]
-                                pixel = (pixel * 255) // (
-                                    (1 << bits_per_component) - 1
-                                )
-                                surface_data[idx_out] = pixel  # Blue
-                                surface_data[idx_out + 1] = pixel  # Green
-                                surface_data[idx_out + 2] = pixel  # Red
-                                surface_data[idx_out + 3] = 255  # Alpha
-                            elif color_cs == "/DeviceRGB":
-                                # TODO: extract the 3 values r,g,b from the single byte
-                                pass
-
-                            elif color_cs == "/DeviceCMYK":
-                                # TODO: extract the 4 values c,m,y,k from the single byte
-                                pass
-
-                            else:
-                                raise Exception("Why are you here !!!")
-                        else:
-                            if color_cs == "/DeviceGray":
-                                raise Exception("Why are you here !!!")
-                            else:
-                                r = data[idx_in]
-                                g = (
-                                    data[idx_in + 1]
-                                    if idx_in + 1 < len(data)
-                                    else self.raise_exception(
-                                        "missing g/m value"
-                                    )
-                                )
-                                b = (
-                                    data[idx_in + 2]
-                                    if idx_in + 2 < len(data)
-                                    else self.raise_exception(
-                                        "missing b/y value"
-                                    )
-                                    # else 0
-                                )
-                                if color_cs == "/DeviceRGB":
-                                    surface_data[idx_out] = b  # Blue
-                                    surface_data[idx_out + 1] = g  # Green
-                                    surface_data[idx_out + 2] = r  # Red
-                                    surface_data[idx_out + 3] = 255  # Alpha
-                                elif color_cs == "/DeviceCMYK":
-                                    pass
-                                    # c, m, y = r, g, b
-                                    # k = (
-                                    #     data[idx_in + 3]
-                                    #     if idx_in + 3 < len(data)
-                                    #     else self.raise_exception(
-                                    #         "missing k value"
-                                    #     )
-                                    # )
-
-                    else:
-                        raise Exception("Exceeded image boundaries !!")
+        surface_pixels = np.ndarray(
+            (height, stride // 4, 4), dtype=np.uint8, buffer=surface.get_data()
+        )
+        surface_pixels[:, :width] = bgra
         surface.mark_dirty()
 
         x, y = self.state.position
 
         # self.ctx.save()
         self.ctx.translate(x, y)
+        # cairo's ctm no longer matches the state
+        self.state.matrix_dirty = True
+        self.state.matrix_changes += 1
         self.ctx.set_source_surface(surface, 0, 0)
         source = self.ctx.get_source()
         source.set_filter(cairo.FILTER_FAST)
@@ -754,28 +669,46 @@ class BaseRenderer:
     def raise_exception(self, msg):
         raise Exception(msg)
 
-    def sync_matrix(self, after: str = ""):
+    def sync_matrix_if_dirty(self):
         """Sync Cairo's CTM with the current PDF state matrix"""
-        current_matrix = self.state.get_current_matrix()
-        # self.ctx.set_matrix(Matrix())
-        # print(
-        #     current_matrix,
-        #     "in text" if self.state.in_text_block else "not in text",
-        #     ",after op=",
-        #     after,
-        # )
-        self.ctx.set_matrix(current_matrix)
+        state = self.state
+        if state.matrix_dirty:
+            self.ctx.set_matrix(state.get_current_matrix())
+            state.matrix_dirty = False
+            self.matrix_syncs += 1
 
     def sync_color(
         self,
     ):
         pass
 
-    def execute_command(self, cmd: PdfOperator):
+    def get_dispatch_table(self) -> list[tuple]:
+        """
+        resolves every operator once per renderer (the handlers are bound
+        to it, they read the current self.state):
+        table[cmd.opcode] = (matrix sync, renderer handler, shows text),
+        the handlers may be None.
+        the last entry is the one of unknown operators (opcode -1)
+        """
+        if self.dispatch_table is not None:
+            return self.dispatch_table
+        sync_map = {}
         for ops, sfunc in self.sync_functions_map:
-            if cmd.name in ops:
-                sfunc(cmd.name)
-        func = self.functions_map.get(cmd.name)
+            for name in ops:
+                sync_map[name] = sfunc
+        self.dispatch_table = [
+            (
+                sync_map.get(name),
+                self.functions_map.get(name),
+                name in self.TEXT_SHOWING_OPERATORS,
+            )
+            for name in (*PdfOperator.OPCODE_NAMES, None)
+        ]
+        return self.dispatch_table
+
+    def execute_command(self, cmd: PdfOperator):
+        sync, func, _ = self.get_dispatch_table()[cmd.opcode]
+        sync is not None and sync()
         if func:
             return func(cmd)
         else:
@@ -789,3 +722,36 @@ class BaseRenderer:
         # open_image_in_irfan(filename)
         # input("Press Enter to continue...")
         # kill_with_taskkill()
+
+
+class GeometryRenderer(BaseRenderer):
+    """
+    headless renderer: interprets the same operators as BaseRenderer but
+    only tracks the text position and emits the SymSequences to the
+    detectors. nothing is drawn, there is no cairo surface/context at all
+    (ctx is None), so no page surface is allocated.
+    """
+
+    paint = False
+
+    def __init__(
+        self,
+        state: EngineState,
+        detector_lists: list[BaseDetector],
+        clean: int,
+    ) -> None:
+        super().__init__(state, detector_lists, clean)
+        # every other operator handled by BaseRenderer only draws
+        self.functions_map = {
+            name: (
+                self.functions_map[name]
+                if name in self.TEXT_SHOWING_OPERATORS
+                else self.ignore_operator
+            )
+            for name in self.functions_map
+        }
+        # the cairo ctm is never used
+        self.sync_functions_map = []
+
+    def ignore_operator(self, _: PdfOperator):
+        return "", True
@@ -0,0 +1,77 @@
+from types import MappingProxyType
+
+from pypdf import PdfReader
+from pypdf.generic import DictionaryObject, IndirectObject
+
+# ************************************************************************
+# ********************** Resource Resolver *******************************
+# ************************************************************************
+# the resource categories of a page or form (/ExtGState, /ColorSpace,
+# /XObject) are resolved once per document: every indirect entry is
+# resolved only once (keyed on its reference), a category dict is cached
+# on its reference if it is shared, or on the dict itself if it belongs
+# to a single page (direct pdf object, it lives as long as the reader).
+# the merged resources of form xobjects are plain dicts built for every
+# Do, they are not cached (only their entries are).
+# the resolved maps are read-only views (MappingProxyType), they are
+# shared by all pages and forms of the document, never copied.
+
+
+class ResourceResolver:
+
+    def __init__(self, reader: PdfReader) -> None:
+        self.reader = reader
+        # (idnum, generation) -> resolved object
+        self.objects: dict[tuple[int, int], object] = {}
+        # reference or id(dict) -> (dict | None, view)
+        self.categories: dict = {}
+        # page -> [cached, resolved] lookups, for profiling
+        self.page_counts: dict[int, list[int]] = {}
+        self.counts = [0, 0]
+
+    def set_page(self, page: int):
+        """count the following lookups for page"""
+        self.counts = self.page_counts.setdefault(page, [0, 0])
+
+    def resolve(self, obj):
+        if not isinstance(obj, IndirectObject):
+            return obj
+        key = (obj.idnum, obj.generation)
+        value = self.objects.get(key)
+        if value is None:
+            value = self.reader.get_object(obj)
+            self.objects[key] = value
+            self.counts[1] += 1
+        else:
+            self.counts[0] += 1
+        return value
+
+    def get_category(self, res, category: str, build: callable):
+        """
+        read-only view of build(resolved category dict),
+        None if res has no such category
+        """
+        if isinstance(res, DictionaryObject):
+            # get() would resolve the reference we want to key on
+            raw = res.raw_get(category) if category in res else None
+        else:
+            raw = res.get(category)
+        if raw is None:
+            return None
+
+        source = None
+        if isinstance(raw, IndirectObject):
+            key = (raw.idnum, raw.generation)
+        elif isinstance(raw, DictionaryObject):
+            key = id(raw)
+            source = raw
+        else:
+            return MappingProxyType(build(raw))
+
+        entry = self.categories.get(key)
+        if entry is not None and entry[0] is source:
+            self.counts[0] += 1
+            return entry[1]
+        view = MappingProxyType(build(self.resolve(raw)))
+        self.categories[key] = (source, view)
+        return view
@@ -8,7 +8,47 @@ from .pdf_encoding import PdfEncoding as pnc
 
 class PDFStreamParser:
 
-    def __init__(self):
+    # ________________________________________________________________
+    # LEXER_REGEX       : legacy three-stage substitution (primitives,
+    #                     arrays, dicts) through placeholder ids
+    # LEXER_SINGLE_PASS : walk the raw stream bytes once, left to right,
+    #                     and emit typed operands/operators directly
+    LEXER_REGEX = 0
+    LEXER_SINGLE_PASS = 1
+
+    DELIMITERS = rb"\s\x00()<>\[\]{}/%"
+    TOKEN_REGEX = re.compile(
+        rb"(?P<ws>[\s\x00]+)"
+        rb"|(?P<number>[+-]?(?:\d+\.?\d*|\.\d+))"
+        rb"|(?P<dict_open><<)"
+        rb"|(?P<dict_close>>>)"
+        rb"|<(?P<hex>[0-9a-fA-F\s]*)>"
+        rb"|(?P<inline>/(?:W|H|IM|BPC|CS|D|F|DP))(?!\w)"
+        rb"|(?P<name>/[^" + DELIMITERS + rb"]*)"
+        rb"|\((?P<string>(?:[^\\()]|\\[\s\S])*)\)"
+        rb"|(?P<nested_string>\()"
+        rb"|(?P<array_open>\[)"
+        rb"|(?P<array_close>\])"
+        rb"|(?P<comment>%[^\r\n]*)"
+        rb"|(?P<image>ID)"
+        rb"|(?P<operator>[^" + DELIMITERS + rb"]+)"
+        rb"|(?P<error>[\s\S])"
+    )
+    # backslash escapes inside literal strings (PDF 32000, 7.3.4.2)
+    ESCAPE_REGEX = re.compile(rb"\\(?:([0-7]{1,3})|(\r\n|[\r\n])|([\s\S]))")
+    ESCAPE_MAP = {
+        b"n": b"\n",
+        b"r": b"\r",
+        b"t": b"\t",
+        b"b": b"\b",
+        b"f": b"\f",
+    }
+    # "EI" preceded by the single white-space ending the image data
+    IMAGE_END_REGEX = re.compile(rb"(?:\r\n|[\s\x00])?EI(?![^\s\x00])")
+    OPERATORS_MAP = {op.encode("latin1"): op for op in PdfOperator.OPERTORS_SET}
+
+    def __init__(self, lexer: int = LEXER_SINGLE_PASS):
+        self.lexer = lexer
         OR = "|"
         NOT_ESCAPE = r"(?:[^\\]|[^\\](?:\\{2})+|[\\](?=\)\]\s*TJ))"
 
@@ -86,10 +126,178 @@ class PDFStreamParser:
         self.arrays_counter = 0
         self.dict_counter = 0
         self.variables_dict = {}
-        self.data: str = ""
+        self.data: bytes | None = None
         self.tokens = []
 
     def iterate(self):
+        if self.lexer == self.LEXER_SINGLE_PASS:
+            return self.iterate_single_pass()
+        return self.iterate_regex()
+
+    def parse_stream(self, stream_content: bytes | str):
+        if self.lexer == self.LEXER_SINGLE_PASS:
+            if isinstance(stream_content, str):
+                stream_content = pnc.string_to_bytes(stream_content)
+            self.data = stream_content
+            return self
+        if not isinstance(stream_content, str):
+            stream_content = pnc.bytes_to_string(
+                bytes(stream_content), unicode_excape=True
+            )
+        return self.parse_stream_regex(stream_content)
+
+    # *******************************************************
+    # **************** Single Pass Lexer  *******************
+    # _______________________________________________________
+
+    def iterate_single_pass(self):
+        """walk self.data once, left to right, yielding PdfOperator objects.
+        operands are pushed into the enclosing array/dict (if any) or into
+        the argument list of the next operator.
+        string and inline-image operands are memoryview slices of the
+        stream (bytes if the string had to be unescaped)"""
+        data = self.data
+        if data is None:
+            raise ValueError("No tokens to parse")
+
+        view = memoryview(data)
+        match = self.TOKEN_REGEX.match
+        operators_map = self.OPERATORS_MAP
+        end = len(data)
+        pos = 0
+        arguements = []
+        # each entry : (is_dict, items)
+        containers: list[tuple[bool, list]] = []
+        inline_op = None
+
+        while pos < end:
+            m = match(data, pos)
+            kind = m.lastgroup
+            pos = m.end()
+
+            if kind == "ws" or kind == "comment":
+                continue
+            elif kind == "operator":
+                token = m.group(kind)
+                op_name = operators_map.get(token)
+                if op_name is not None:
+                    yield PdfOperator(op_name, arguements)
+                    arguements = []
+                    continue
+                elif token == b"true" or token == b"false":
+                    value = token == b"true"
+                else:
+                    self.raise_unknown_token(token, m.start(), arguements)
+            elif kind == "number":
+                value = float(m.group(kind))
+            elif kind == "name":
+                value = m.group(kind).decode("latin1")
+            elif kind == "string":
+                s_start, s_end = m.span(kind)
+                value = self.decode_string(view[s_start:s_end])
+            elif kind == "nested_string":
+                s_start = pos
+                pos = self.find_string_end(data, s_start)
+                value = self.decode_string(view[s_start : pos - 1])
+            elif kind == "array_open":
+                containers.append((False, []))
+                continue
+            elif kind == "dict_open":
+                containers.append((True, []))
+                continue
+            elif kind == "array_close" or kind == "dict_close":
+                is_dict = kind == "dict_close"
+                if not containers or containers[-1][0] != is_dict:
+                    self.raise_unknown_token(
+                        m.group(kind), m.start(), arguements
+                    )
+                is_dict, items = containers.pop()
+                value = dict(zip(items[::2], items[1::2])) if is_dict else items
+            elif kind == "hex":
+                value = self.decode_hex(m.group(kind))
+            elif kind == "inline":
+                value = m.group(kind).decode("latin1")
+                if not containers:
+                    if len(arguements) > 0:
+                        print("args = ", arguements)
+                        raise Exception("unhandled args")
+                    inline_op = value
+                    continue
+            elif kind == "image":
+                img_end = self.IMAGE_END_REGEX.search(data, pos)
+                if img_end is None:
+                    yield PdfOperator("ID", arguements)
+                    arguements = []
+                    continue
+                # skip the single white-space following "ID"
+                img_start = pos
+                if data.startswith(b"\r\n", img_start):
+                    img_start += 2
+                elif img_start < img_end.start():
+                    img_start += 1
+                pos = img_end.start()
+                yield PdfOperator("ID", [view[img_start:pos]])
+                continue
+            else:
+                self.raise_unknown_token(m.group(kind), m.start(), arguements)
+
+            if containers:
+                containers[-1][1].append(value)
+            elif inline_op:
+                yield PdfOperator(inline_op, [value])
+                inline_op = None
+            else:
+                arguements.append(value)
+
+    def find_string_end(self, data: bytes, pos: int):
+        """return the index after the ")" closing a literal string that
+        contains balanced (unescaped) parentheses, pos is the index after
+        the opening "(" """
+        depth = 1
+        end = len(data)
+        while pos < end:
+            c = data[pos]
+            pos += 1
+            if c == 0x5C:  # backslash
+                pos += 1
+            elif c == 0x28:  # (
+                depth += 1
+            elif c == 0x29:  # )
+                depth -= 1
+                if depth == 0:
+                    return pos
+        raise Exception("unterminated string")
+
+    def decode_string(self, value: memoryview):
+        if 0x5C not in value:
+            return value
+        return self.ESCAPE_REGEX.sub(self.unescape, value)
+
+    def unescape(self, m: re.Match):
+        octal, eol, char = m.groups()
+        if octal:
+            return bytes((int(octal, 8) & 0xFF,))
+        if eol:
+            return b""
+        return self.ESCAPE_MAP.get(char, char)
+
+    def decode_hex(self, value: bytes):
+        value = b"".join(value.split())
+        if len(value) % 2:
+            value += b"0"
+        return bytes.fromhex(value.decode("ascii"))
+
+    def raise_unknown_token(self, token: bytes, start: int, arguements: list):
+        print("----", token)
+        context = self.data[max(start - 50, 0) : start]
+        print("prev_token", arguements, repr(context))
+        raise Exception("----" + repr(token))
+
+    # *******************************************************
+    # **************** Regex Substitution Lexer *************
+    # _______________________________________________________
+
+    def iterate_regex(self):
         if not self.tokens:
             raise ValueError("No tokens to parse")
 
@@ -135,7 +343,7 @@ class PDFStreamParser:
                 raise Exception("----" + token)
         self.tokens = []
 
-    def parse_stream(self, stream_content: str):
+    def parse_stream_regex(self, stream_content: str):
         self.variables_dict = {}
         self.arrays_counter = 0
         self.dict_counter = 0
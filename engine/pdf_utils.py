@@ -1,6 +1,8 @@
 from sys import exc_info
+import hashlib
 import numpy as np
 import cairo
+from PIL import Image
 import subprocess
 import os
 from os.path import sep
@@ -22,6 +24,16 @@ all_subjects = [
     if os.path.isdir(igcse_path + sep + f) and f.isdigit()
 ]
 
+
+def get_pdf_hash(pdf_path: str):
+    """sha256 of the pdf content (not of its path)"""
+    sha = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
 # ************************************************************************
 # ********************** Page Segmentation *******************************
 # ************************************************************************
@@ -70,6 +82,156 @@ def crop_image_surface(out_surf: cairo.ImageSurface, y_start, y_end, padding):
     return out_surf
 
 
+# ************************************************************************
+# ********************** Image Conversion ********************************
+# ************************************************************************
+
+
+def image_data_to_bgra(
+    data, width, height, bits_per_component, color_cs, fill_color
+):
+    """
+    Convert decoded image samples to a (height, width, 4) uint8 BGRA array
+    (cairo FORMAT_ARGB32 byte order).
+    same output as image_data_to_bgra_legacy, except that 8 bit
+    DeviceRGB/DeviceCMYK samples are converted (they were left transparent).
+    returns None for layouts that are only handled by the legacy loops.
+    """
+    count = width * height
+    src = np.frombuffer(data, dtype=np.uint8)
+    bgra = np.zeros((height, width, 4), dtype=np.uint8)
+    pixels = bgra.reshape(count, 4)
+
+    if bits_per_component == 1:
+        # stencil: 0 -> fill color, 1 -> transparent
+        # (one continuous bit stream, rows are not byte aligned)
+        r, g, b = [int(c) for c in fill_color]
+        bits = np.unpackbits(src[: (count + 7) // 8])[:count]
+        painted = np.zeros(count, dtype=bool)
+        painted[: len(bits)] = bits == 0
+        pixels[painted] = (b, g, r, 255)
+        return bgra
+
+    if bits_per_component == 8 and color_cs == "/DeviceGray":
+        if len(src) < count:
+            raise Exception("Exceeded image boundaries !!")
+        gray = src[:count]
+        pixels[:, 0] = gray
+        pixels[:, 1] = gray
+        pixels[:, 2] = gray
+        pixels[:, 3] = 255
+        return bgra
+
+    if (bits_per_component == 8 and color_cs == "/DeviceRGB") or (
+        bits_per_component == 24 and color_cs == "/DeviceRGB"
+    ):
+        # 24 : already decoded (e.g. DCT) 3 bytes per pixel
+        if len(src) < count * 3:
+            raise Exception("Exceeded image boundaries !!")
+        rgb = src[: count * 3].reshape(count, 3)
+        pixels[:, 0] = rgb[:, 2]
+        pixels[:, 1] = rgb[:, 1]
+        pixels[:, 2] = rgb[:, 0]
+        pixels[:, 3] = 255
+        return bgra
+
+    if bits_per_component == 8 and color_cs == "/DeviceCMYK":
+        if len(src) < count * 4:
+            raise Exception("Exceeded image boundaries !!")
+        img = Image.frombuffer(
+            "CMYK", (width, height), src[: count * 4], "raw", "CMYK", 0, 1
+        )
+        # PIL's raw encoder does the channel swizzling
+        data = img.convert("RGBA").tobytes("raw", "BGRA")
+        return np.frombuffer(data, dtype=np.uint8).reshape(height, width, 4)
+
+    if bits_per_component == 32:
+        # already decoded to BGRA (e.g. EngineState.decode_dct)
+        if len(src) < count * 4:
+            raise Exception("Exceeded image boundaries !!")
+        return src[: count * 4].reshape(height, width, 4)
+
+    return None
+
+
+def image_data_to_bgra_legacy(
+    data, width, height, bits_per_component, color_cs, fill_color
+):
+    """
+    per-pixel reference implementation (the original draw_inline_image
+    loops), used for the layouts image_data_to_bgra does not handle and to
+    check image_data_to_bgra against.
+    """
+    stride = width * 4
+    surface_data = bytearray(stride * height)
+
+    if bits_per_component == 1:
+        r, g, b = [int(c) for c in fill_color]
+
+        for y in range(height):
+            for x in range(width):
+                byte_index = (y * width + x) // 8
+                bit_index = 7 - ((y * width + x) % 8)
+
+                if byte_index < len(data):
+                    bit_value = (data[byte_index] >> bit_index) & 1
+                    idx = y * stride + x * 4
+
+                    if bit_value == 0:  # Black pixel
+                        surface_data[idx] = b  # Blue
+                        surface_data[idx + 1] = g  # Green
+                        surface_data[idx + 2] = r  # Red
+                        surface_data[idx + 3] = 255  # Alpha
+                    else:
+                        surface_data[idx] = 0  # Blue
+                        surface_data[idx + 1] = 0  # Green
+                        surface_data[idx + 2] = 0  # Red
+                        surface_data[idx + 3] = 0  # Alpha (transparent)
+    else:
+        bytes_per_pixel = bits_per_component // 8
+
+        if bytes_per_pixel == 0:
+            bytes_per_pixel = 1
+
+        for y in range(height):
+            for x in range(width):
+                idx_out = y * stride + x * 4
+                idx_in = (y * width + x) * bytes_per_pixel
+
+                if idx_in + bytes_per_pixel > len(data):
+                    raise Exception("Exceeded image boundaries !!")
+                if bits_per_component <= 8:
+                    if color_cs == "/DeviceGray":
+                        pixel = data[idx_in]
+                        pixel = (pixel * 255) // ((1 << bits_per_component) - 1)
+                        surface_data[idx_out] = pixel  # Blue
+                        surface_data[idx_out + 1] = pixel  # Green
+                        surface_data[idx_out + 2] = pixel  # Red
+                        surface_data[idx_out + 3] = 255  # Alpha
+                    elif color_cs in ["/DeviceRGB", "/DeviceCMYK"]:
+                        # TODO: extract the values from the single byte
+                        pass
+                    else:
+                        raise Exception("Why are you here !!!")
+                else:
+                    if color_cs == "/DeviceGray":
+                        raise Exception("Why are you here !!!")
+                    if idx_in + 2 >= len(data):
+                        raise Exception("missing g/m or b/y value")
+                    r = data[idx_in]
+                    g = data[idx_in + 1]
+                    b = data[idx_in + 2]
+                    if color_cs == "/DeviceRGB":
+                        surface_data[idx_out] = b  # Blue
+                        surface_data[idx_out + 1] = g  # Green
+                        surface_data[idx_out + 2] = r  # Red
+                        surface_data[idx_out + 3] = 255  # Alpha
+
+    return np.frombuffer(surface_data, dtype=np.uint8).reshape(
+        height, width, 4
+    )
+
+
 # *********************************************************
 # *****************++ Numeric, Roman and Alphabet numbering
 # ******************* Handler :
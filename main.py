@@ -84,6 +84,8 @@ class CmdArgs:
             self.open_pdf = args.summatra
             self.open_nvim = args.nvim
             self.force = args.force
+            self.workers = args.workers
+            self.render_cache = args.render_cache
             self.range = self.convet_range_string_to_list(args.range)
             if self.test == "subjects":
                 return
@@ -280,6 +282,12 @@ class CmdArgs:
                 "font-show",
                 "font-missing",
                 "parser",
+                "parser-equivalence",
+                "operators-benchmark",
+                "render-benchmark",
+                "glyphs-benchmark",
+                "memory-benchmark",
+                "inline-image",
                 "renderer-show",
                 "renderer-silent",
                 "questions-count",
@@ -288,6 +296,8 @@ class CmdArgs:
                 "questions-save",
                 # ___
                 "extract-questions",
+                "batch-extract",
+                "questions-replay",
                 "view-question",
                 "view-page",
                 "subjects",
@@ -334,6 +344,23 @@ class CmdArgs:
         test.add_argument("--debug", "-d", action="store_true", default=False)
         test.add_argument("--pause", action="store_true", default=False)
         test.add_argument("--summatra", action="store_true", default=False)
+        test.add_argument(
+            "--workers",
+            "-w",
+            type=int,
+            default=1,
+            help="number of worker processes (the pages of an exam, "
+            + "or the exams for batch-extract)",
+        )
+        test.add_argument(
+            "--render-cache",
+            type=str,
+            nargs="?",
+            const=f"temp{sep}render-cache",
+            default=None,
+            help="reuse the rendered pages (raster + text geometry) "
+            + "from this directory, for view-page/view-question",
+        )
 
         test.add_argument(
             "--force",
@@ -1,3 +1,6 @@
+from array import array
+from itertools import chain
+from operator import add, sub
 import cairo
 import numpy as np  # speeds things up; pure-Python fallback shown later
 from engine.pdf_utils import all_subjects, _surface_as_uint32
@@ -11,6 +14,10 @@ import os
 
 
 class Box:
+    # the models are created by the thousands (segments, parts, ...), the
+    # subclasses declare their own attributes in __slots__ too (no __dict__)
+    __slots__ = ("x", "y", "w", "h", "box")
+
     def __init__(self, x, y, w, h):
         self.x = x
         self.y = y
@@ -59,6 +66,8 @@ class Box:
 
 
 class Part(Box):
+    __slots__ = ("label",)
+
     def __init__(self, label, x, y, x1, y1) -> None:
         super().__init__(x, y, x1 - x, y1 - y)
         self.label = label
@@ -66,6 +75,8 @@ class Part(Box):
 
 
 class SubPart(Box):
+    __slots__ = ("label",)
+
     def __init__(self, label, x, y, x1, y1) -> None:
         super().__init__(x, y, x1 - x, y1 - y)
         self.label = label
@@ -73,6 +84,7 @@ class SubPart(Box):
 
 
 class Symbol(Box):
+    __slots__ = ("ch", "threshold_y", "threshold_x")
     LINE_HEIGHT_FACTOR = 4.2
 
     def __init__(self, ch, x, y, w, h) -> None:
@@ -109,7 +121,51 @@ class Symbol(Box):
     #     s2: Symbol = s2
 
 
+class SymbolTable:
+    """
+    the symbols of a page in parallel columns (chars + x, y, w, h), a
+    SymSequence can be a view on some rows of the table, the Symbol objects
+    are only created when a detector asks for them
+    """
+
+    __slots__ = ("chars", "x", "y", "w", "h")
+
+    def __init__(self) -> None:
+        self.chars: list[str] = []
+        self.x = array("d")
+        self.y = array("d")
+        self.w = array("d")
+        self.h = array("d")
+
+    def __len__(self):
+        return len(self.chars)
+
+    def extend(self, rows: list[tuple]) -> range:
+        """rows: (ch, x, y, w, h) tuples, returns the range of the new rows"""
+        start = len(self.chars)
+        chars, x, y, w, h = zip(*rows)
+        self.chars.extend(chars)
+        self.x.extend(x)
+        self.y.extend(y)
+        self.w.extend(w)
+        self.h.extend(h)
+        return range(start, len(self.chars))
+
+    def get_symbol(self, i: int) -> Symbol:
+        return Symbol(
+            self.chars[i], self.x[i], self.y[i], self.w[i], self.h[i]
+        )
+
+    def is_connected(self, i: int, j: int):
+        """same as Symbol.is_connected_with, for the rows i and j"""
+        x, w = self.x, self.w
+        left, right = (i, j) if x[i] < x[j] else (j, i)
+        inner_diff = x[right] - (x[left] + w[left])
+        return inner_diff < 0.45 * w[i] or inner_diff < 0.45 * w[j]
+
+
 class BoxSegments(Box):
+    __slots__ = ("data",)
 
     def __init__(self, segments: list[Box]) -> None:
         if not segments:
@@ -150,50 +206,221 @@ class BoxSegments(Box):
 
 
 class SymSequence(BoxSegments):
+    # data is a property (the Symbols of a view are created lazily)
+    __slots__ = (
+        "font",
+        "table",
+        "_parts",
+        "_count",
+        "_extent",
+        "_data",
+        "mean",
+        "threshold_y",
+        "threshold_x",
+    )
 
-    def __init__(self, symboles: list[Symbol]) -> None:
+    def __init__(
+        self, symboles: list[Symbol], font: str | None = None
+    ) -> None:
         if not symboles:
             raise Exception("empty Sequence")
+        # base font name of the text-show operator (None if unknown)
+        self.font = font
+        # only set for a view on a SymbolTable (see from_table)
+        self.table: SymbolTable | None = None
+        self._parts = None
         super().__init__(
             sorted(
                 symboles,
                 key=self.sort_func,
             )
         )
+        self.__init_thresholds__()
+
+    @classmethod
+    def from_table(cls, table: SymbolTable, indices, font=None):
+        """a sequence of the rows `indices` of table, no Symbol is created
+        until .data is used (and the rows are sorted on first use)"""
+        if not indices:
+            raise Exception("empty Sequence")
+        if isinstance(indices, range):
+            # the rows of a text-show operator, sliced in C
+            rows = slice(indices.start, indices.stop)
+            xs, ys, ws, hs = (
+                col[rows] for col in (table.x, table.y, table.w, table.h)
+            )
+        else:
+            xs, ys, ws, hs = (
+                [col[i] for i in indices]
+                for col in (table.x, table.y, table.w, table.h)
+            )
+        # same as BoxSegments.__set_box__ on the Symbol boxes
+        box = (
+            min(xs),
+            min(map(sub, ys, hs)),
+            max(map(add, xs, ws)),
+            max(ys),
+        )
+        return cls.from_runs(
+            table, [(True, [indices])], box, len(indices), font
+        )
+
+    @classmethod
+    def from_runs(cls, table: SymbolTable, parts, box, count, font=None):
+        """
+        parts: the order of the rows is the concatenation of the parts, a
+        part is (sort, runs): the rows of its runs, stable sorted by x if
+        sort. (sorting a concatenation that contains sorted parts gives the
+        same order as sorting their runs, so the runs are only sorted once)
+        box: bounding box of all rows
+        """
+        self = cls.__new__(cls)
+        self.font = font
+        self.table = table
+        self._parts: list[tuple[bool, list]] = parts
+        self._count = count
+        self._data = None
+        self._extent = box
+        self.box = box
+        self.x, self.y = box[0], box[1]
+        self.w = box[2] - box[0]
+        self.h = box[3] - box[1]
+        self.__init_thresholds__()
+        return self
+
+    def __init_thresholds__(self):
         self.mean = (0, 0)
-        self.data: list[Symbol] = self.data
         self.__set_mean__(self.box)
         self.threshold_y = 0.3 * (self.box[-1] - self.box[1])
         self.threshold_x = 0.3 * (self.box[-2] - self.box[0])
-        pass
+
+    @property
+    def indices(self) -> list[int]:
+        """the rows of a view in order (sorted once, then kept)"""
+        parts = self._parts
+        if len(parts) > 1 or parts[0][0] or len(parts[0][1]) > 1:
+            key = self.table.x.__getitem__
+            order = []
+            for sort, runs in parts:
+                if sort:
+                    order.extend(sorted(chain.from_iterable(runs), key=key))
+                else:
+                    order.extend(chain.from_iterable(runs))
+            self._parts = parts = [(False, [order])]
+        return parts[0][1][0]
+
+    @property
+    def data(self) -> list[Symbol]:
+        if self._data is None:
+            get_symbol = self.table.get_symbol
+            self._data = [get_symbol(i) for i in self.indices]
+        return self._data
+
+    @data.setter
+    def data(self, data: list[Symbol]):
+        self._data = data
+
+    def is_view(self):
+        """True as long as the Symbols were not created"""
+        return self._data is None
+
+    def __getitem__(self, index) -> Symbol:
+        if self._data is None and isinstance(index, int):
+            return self.table.get_symbol(self.indices[index])
+        return self.data[index]
+
+    def __len__(self):
+        if self._data is None:
+            return self._count
+        return len(self._data)
+
+    def size(self):
+        return len(self)
+
+    def get_chars(self) -> list[str]:
+        if self._data is None:
+            chars = self.table.chars
+            return [chars[i] for i in self.indices]
+        return [sym.ch for sym in self._data]
+
+    def get_columns(self):
+        """(chars, x, y, w, h) lists of the symbols"""
+        if self._data is None:
+            t, idx = self.table, self.indices
+            return tuple(
+                [col[i] for i in idx] for col in (t.chars, t.x, t.y, t.w, t.h)
+            )
+        data = self._data
+        return (
+            [sym.ch for sym in data],
+            [sym.x for sym in data],
+            [sym.y for sym in data],
+            [sym.w for sym in data],
+            [sym.h for sym in data],
+        )
 
     def sort_func(self, elem: Box):
         return elem.x
 
     def extend(self, new_syms: list[Symbol]):
+        if (
+            self._data is None
+            and isinstance(new_syms, SymSequence)
+            and new_syms._data is None
+            and new_syms.table is self.table
+        ):
+            # same as below, without touching the rows: self keeps its order
+            # followed by the new rows (and its box), the returned sequence
+            # has all rows sorted (lazily) and the union of the two boxes
+            (x0, y0, x1, y1), (nx0, ny0, nx1, ny1) = (
+                self._extent,
+                new_syms._extent,
+            )
+            self._extent = (
+                min(x0, nx0),
+                min(y0, ny0),
+                max(x1, nx1),
+                max(y1, ny1),
+            )
+            self._parts.extend(new_syms._parts)
+            self._count += new_syms._count
+            runs = [run for _, part_runs in self._parts for run in part_runs]
+            return SymSequence.from_runs(
+                self.table,
+                [(True, runs)],
+                self._extent,
+                self._count,
+                self.font,
+            )
         n_data = self.data
         n_data.extend(new_syms)
         # n_data_sorted = sorted(n_data, key=self.sort_func)
-        self = SymSequence(n_data)
+        self = SymSequence(n_data, self.font)
         return self
 
     def iterate_split(self, char: str = " "):
+        if self._data is None:
+            yield from self.iterate_split_rows(char)
+            return
         sub = []
         for sym in self.data:
             if sym.ch in char:
                 if len(sub) > 0:
-                    yield SymSequence(sub)
+                    yield SymSequence(sub, self.font)
                 sub = []
             else:
                 sub.append(sym)
 
         if len(sub) > 0:
-            yield SymSequence(sub)
+            yield SymSequence(sub, self.font)
 
     def iterate_split_space(
         self,
     ):
         seps: str = " \t"
+        if self._data is None:
+            yield from self.iterate_split_rows(seps, split_unconnected=True)
+            return
         sub = []
         for i, sym in enumerate(self.data):
             n_sym = None
@@ -203,17 +430,42 @@ class SymSequence(BoxSegments):
                 sym.ch in seps
             ):  # or (n_sym and not sym.is_connected_with(n_sym)):
                 if len(sub) > 0:
-                    yield SymSequence(sub)
+                    yield SymSequence(sub, self.font)
                 sub = []
             elif n_sym and not sym.is_connected_with(n_sym):
                 sub.append(sym)
-                yield SymSequence(sub)
+                yield SymSequence(sub, self.font)
                 sub = []
             else:
                 sub.append(sym)
 
         if len(sub) > 0:
-            yield SymSequence(sub)
+            yield SymSequence(sub, self.font)
+
+    def iterate_split_rows(self, seps: str, split_unconnected=False):
+        """iterate_split(_space) of a view, yields views"""
+        table, indices, font = self.table, self.indices, self.font
+        chars = table.chars
+        sub = []
+        for k, i in enumerate(indices):
+            n_i = indices[k + 1] if k + 1 < len(indices) else None
+            if chars[i] in seps:
+                if len(sub) > 0:
+                    yield SymSequence.from_table(table, sub, font)
+                sub = []
+            elif (
+                split_unconnected
+                and n_i is not None
+                and not table.is_connected(i, n_i)
+            ):
+                sub.append(i)
+                yield SymSequence.from_table(table, sub, font)
+                sub = []
+            else:
+                sub.append(i)
+
+        if len(sub) > 0:
+            yield SymSequence.from_table(table, sub, font)
 
     def get_text(self, verbose=True, data=None) -> str:
         rep = ""
@@ -261,6 +513,8 @@ class SymSequence(BoxSegments):
 
 
 class Paragraph:
+    __slots__ = ("lines",)
+
     def __init__(self, lines: list[SymSequence]):
         if not lines:
             raise Exception("empty Paragraph")
@@ -316,6 +570,19 @@ class Paragraph:
 
 
 class SurfaceGapsSegments(BoxSegments):
+    __slots__ = (
+        "surface_loader",
+        "_surface",
+        "gap_factor",
+        "MIN_GAP_HEIGHT",
+        "scale",
+        "width",
+        "height",
+        "net_height",
+        "empty_segments",
+        "non_empty_segments",
+        "d0",
+    )
 
     def __init__(
         self, surface: cairo.ImageSurface, gap_factor: float = 0.5, scale=None
@@ -325,19 +592,64 @@ class SurfaceGapsSegments(BoxSegments):
         factor == 0     => then every line will be in its own seqment
         factor == 100   => the whole page will be treated as one segment
         """
+        self.surface_loader = None
         self.surface = surface
-        s_height = surface.get_height()
-        self.net_height = s_height
-        self.empty_segments: list[Box] = []
-        self.non_empty_segments: list[Box] = []
+        self.__init_sizes__(surface.get_width(), surface.get_height())
         self.gap_factor = gap_factor
-        self.d0 = s_height * 0.01
         self.MIN_GAP_HEIGHT = self.gap_factor * self.d0
         self.scale = scale
 
         self.find_empty_gaps(0)
+        self.__init_segments__()
+
+        # segments = get_segments( 0, s_height, d0, factor=gap_factor)
+        # out_height += sum(seg_h + 2 * d2 for _, seg_h, d2 in segments)
+
+    @classmethod
+    def from_empty_gaps(
+        cls,
+        empty_segments: list[Box],
+        width: int,
+        height: int,
+        surface_loader: callable,
+        gap_factor: float = 0.5,
+        scale=None,
+    ):
+        """rebuild the segments from gaps already found (e.g. by a worker
+        process), surface_loader() is only called once the pixels are
+        needed (drawing a question)"""
+        self = cls.__new__(cls)
+        self.surface_loader = surface_loader
+        self._surface = None
+        self.__init_sizes__(width, height)
+        self.gap_factor = gap_factor
+        self.MIN_GAP_HEIGHT = self.gap_factor * self.d0
+        self.scale = scale
+        self.empty_segments = empty_segments
+        self.__init_segments__()
+        return self
+
+    @property
+    def surface(self) -> cairo.ImageSurface:
+        if self._surface is None and self.surface_loader is not None:
+            self._surface = self.surface_loader()
+        return self._surface
+
+    @surface.setter
+    def surface(self, surface: cairo.ImageSurface):
+        self._surface = surface
+
+    def __init_sizes__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.net_height = height
+        self.empty_segments: list[Box] = []
+        self.non_empty_segments: list[Box] = []
+        self.d0 = height * 0.01
+
+    def __init_segments__(self):
         self.non_empty_segments, self.net_height = self.get_non_empty_gaps(
-            0, s_height
+            0, self.height
         )
 
         if not self.non_empty_segments:
@@ -346,40 +658,32 @@ class SurfaceGapsSegments(BoxSegments):
         self.data = self.non_empty_segments
         self.__set_box__()
 
-        # segments = get_segments( 0, s_height, d0, factor=gap_factor)
-        # out_height += sum(seg_h + 2 * d2 for _, seg_h, d2 in segments)
-
     def find_empty_gaps(self, min_y=0):
         surface = self.surface
         mask = self.build_blank_mask(surface)
         gaps: list[Box] = []
         h_px = len(mask)
         MIN_COUNT = round(0.1 * self.d0)
-        start = None
-        not_blanck_count = 0
-        blanck_count = 0
-        is_blank_mode = True
-        start = min_y
-        for y, blank in enumerate(mask):
-            if blank:
-                blanck_count += 1
-                not_blanck_count = 0
-            else:
-                not_blanck_count += 1
-                blanck_count = 0
 
-            if blanck_count > MIN_COUNT:
-                is_blank_mode = True
-            elif not_blanck_count > MIN_COUNT:
-                is_blank_mode = False
+        # run-length pass: a run of blank/non-blank rows switches the mode
+        # once it is longer than MIN_COUNT, i.e. at row (run_start + MIN_COUNT)
+        # (short runs are ignored, the page starts in blank mode at min_y)
+        run_starts = np.flatnonzero(np.diff(mask)) + 1
+        run_starts = np.concatenate(([0], run_starts))
+        run_lengths = np.diff(np.append(run_starts, h_px))
+        long_runs = run_starts[run_lengths > MIN_COUNT]
+        switch_rows = (long_runs + MIN_COUNT).tolist()
+        switch_to_blank = mask[long_runs].tolist()
 
-            if is_blank_mode and start is None:
+        start = min_y
+        for y, blank in zip(switch_rows, switch_to_blank):
+            if blank and start is None:
                 start = y
-            elif not is_blank_mode and start is not None:
-                gaps.append(Box(0, start, surface.get_width(), y - start))
+            elif not blank and start is not None:
+                gaps.append(Box(0, start, self.width, y - start))
                 start = None
         if start is not None:  # ran off bottom still in blank
-            gaps.append(Box(0, start, surface.get_width(), h_px - start))
+            gaps.append(Box(0, start, self.width, h_px - start))
 
         fgaps = [
             box
@@ -396,25 +700,23 @@ class SurfaceGapsSegments(BoxSegments):
             gy, gh = box.y, box.h
             if gy > cursor:
                 h_curr = gy - cursor
-                segments.append(
-                    Box(0, cursor, self.surface.get_width(), h_curr)
-                )
+                segments.append(Box(0, cursor, self.width, h_curr))
                 net_height += h_curr
             cursor = gy + gh
 
         if cursor < max_y:  # rows after the last gap
             h_curr = max_y - cursor
-            segments.append(Box(0, cursor, self.surface.get_width(), h_curr))
+            segments.append(Box(0, cursor, self.width, h_curr))
             net_height += h_curr
 
-        if net_height < self.surface.get_height() - 2 * self.d0:
+        if net_height < self.height - 2 * self.d0:
             net_height += 2 * self.d0
 
         return segments, net_height
 
     def filter_question_segments(self, min_y, max_y, page_range, curr_page):
         q_segs = []
-        q_y_min, q_y_max = 0, self.surface.get_height()
+        q_y_min, q_y_max = 0, self.height
         if page_range[0] == curr_page:
             q_y_min = min_y  # - 40 * self.d0  # q.h
         if page_range[-1] == curr_page:
@@ -457,23 +759,28 @@ class SurfaceGapsSegments(BoxSegments):
 
         return q_segs
 
-    def build_blank_mask(self, surface, y0=0, y1=None):
-        pix = _surface_as_uint32(surface, y0, y1)
-        w = surface.get_width()
-        return np.fromiter(
-            (self.row_is_blank(r, w) for r in pix),
-            dtype=bool,
-            count=pix.shape[0],
-        )
-
     OPAQUE_WHITE = 0xFFFFFFFF
     ANY_ALPHA0_WHITE = 0x00FFFFFF  # alpha 0 + white RGB
+    SIDE_FRACTION = 0.15
+    SIDE_MIN_WHITE_RATIO = 0.94
+
+    def build_blank_mask(self, surface, y0=0, y1=None):
+        """row_is_blank for all rows at once (one 2D pass over the pixels)"""
+        w = surface.get_width()
+        pix = _surface_as_uint32(surface, y0, y1)[:, :w]
+        white = (pix == self.OPAQUE_WHITE) | (pix == self.ANY_ALPHA0_WHITE)
+        s_right = round((1 - self.SIDE_FRACTION) * w)
+        is_middle_completly_empyty = white[:, :s_right].all(axis=1)
+        is_side_almost_empty = (
+            np.count_nonzero(white[:, s_right:], axis=1) / (w - s_right)
+        ) > self.SIDE_MIN_WHITE_RATIO
+        return is_middle_completly_empyty & is_side_almost_empty
 
     def row_is_blank(
         self, row, usable_cols, white=OPAQUE_WHITE, twhite=ANY_ALPHA0_WHITE
     ):
         part = row[:usable_cols]
-        f1 = 0.15
+        f1 = self.SIDE_FRACTION
         s_left = round(f1 * usable_cols)
         s_right = round((1 - f1) * usable_cols)
         middle = part[:s_right]
@@ -481,7 +788,7 @@ class SurfaceGapsSegments(BoxSegments):
         # np.concatenate((part[:s_left], part[s_right:]), axis=0)
         is_side_almost_empty = (
             np.count_nonzero((sides == white) | (sides == twhite)) / len(sides)
-        ) > 0.94
+        ) > self.SIDE_MIN_WHITE_RATIO
         is_middle_completly_empyty = np.all(
             (middle == white) | (middle == twhite)
         )
@@ -7,6 +7,15 @@ from engine.pdf_utils import crop_image_surface
 
 
 class QuestionBase(Box):
+    __slots__ = (
+        "parts",
+        "label",
+        "pages",
+        "level",
+        "contents",
+        "y1",
+        "line_height",
+    )
 
     TITLE_DICT = ["Question", "PART", "SUBPART"]
 
@@ -53,7 +62,7 @@ class QuestionBase(Box):
 
     def __to_dict__(self):
         if len(self.parts) > 1:
-            part_dict = ([p.__to_dict__() for p in self.parts],)
+            part_dict = [p.__to_dict__() for p in self.parts]
         else:
             part_dict = []
         return {
@@ -68,8 +77,9 @@ class QuestionBase(Box):
 
     @classmethod
     def __from_dict__(self, qd: dict, shallow: bool, level=0):
+        # w and page_height are not saved
         q = QuestionBase(
-            qd["label"], qd["pages"], level, qd["x"], qd["y"], qd["h"]
+            qd["label"], qd["pages"], level, qd["x"], qd["y"], 0, 0, qd["h"]
         )
         q.y1 = qd["y1"]
         if shallow:
@@ -97,6 +107,8 @@ class Question(QuestionBase):
     # TODO:
     """should include additional field like, question_id,category ,subject,exams ..etc"""
 
+    __slots__ = ("id", "exam", "parent_id", "current_y")
+
     def __init__(
         self,
         id: str,